@@ -9,6 +9,11 @@ echo "--start.sh-- ${PWD}"
 
 cd $DIR
 
+if [ -n "${SLAP_SERVE}" ]; then
+    echo "--start.sh-- serving runs on ${SLAP_SERVE}"
+    exec python slap.py --serve "${SLAP_SERVE}"
+fi
+
 echo "--start.sh-- waiting"
 
 while :
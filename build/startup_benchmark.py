@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Times cold starts of slap.py so start up regressions can be tracked from CI. Every run is a new python process, the
+median and the fastest of the runs are printed, and the exit code is 1 when the median is over --max.
+
+    python build/startup_benchmark.py --runs 10 --max 0.5 -- -c config.yaml --list -a all
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+SLAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'slap.py')
+
+
+def time_run(command):
+    """
+        @param command (list) - The command to run
+        @return (float) - Seconds until the command exited
+    """
+    start = time.time()
+    subprocess.call(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times cold starts of slap.py")
+    parser.add_argument('--runs', default=10, type=int, help='How many times to start slap.py')
+    parser.add_argument('--max', type=float, help='Fails when the median start up takes longer than this many seconds')
+    parser.add_argument('slap_args', nargs='*', default=['--list', '-a', 'all'],
+                        help='Arguments passed to slap.py, defaults to --list -a all')
+    args = parser.parse_args()
+    command = [sys.executable, SLAP] + args.slap_args
+    # THE FIRST RUN WRITES THE .pyc FILES AND THE TEST INDEX, IT ISN'T COUNTED
+    time_run(command)
+    timings = sorted(time_run(command) for _ in range(args.runs))
+    median = timings[len(timings) // 2]
+    print("slap.py {}: median {:.3f}s, fastest {:.3f}s over {} runs".format(' '.join(args.slap_args), median,
+                                                                          timings[0], args.runs))
+    if args.max is not None and median > args.max:
+        print("Start up is over the {:.3f}s budget".format(args.max))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
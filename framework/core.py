@@ -13,15 +13,17 @@ import inspect
 import os
 import re
 import sys
-import json
+from concurrent.futures import ThreadPoolExecutor
 from time import time, localtime, sleep
 from xml.etree import ElementTree as ET
 
-import requests
-
 from .driver import Driver
+from .driver_pool import pool
+from .lazy_driver import LazyDriver
 from library.config import Config
 
+from library.bug_status import get_resolver
+from library.results import add_test
 from library.test_data import map_yaml
 
 import logging
@@ -54,7 +56,14 @@ class Core(object):
           verbs.close_driver()
         """
         if self.driver_state:
-            self.driver.close_driver()
+            driver = self.driver.launched if isinstance(self.driver, LazyDriver) else self.driver
+            # A LAZY BROWSER THAT WAS NEVER USED WAS NEVER STARTED, NOTHING TO CLOSE
+            if driver is None:
+                pass
+            elif getattr(driver, 'pool_key', None):
+                pool.release(driver)
+            else:
+                driver.close_driver()
             self.driver_state = False
         return True
 
@@ -75,7 +84,9 @@ class Core(object):
         test_data_exclusion = config['test_data_exclusion'].split(',') if config[
                                                                               'test_data_exclusion'] is not None else []
         logger.debug("TestData Path: {}".format(test_data_path))
-        td = map_yaml(test_data_path, test_data_exclusion, config['environment'])
+        # PARSED ONCE PER PROCESS AND SHARED BY EVERY TEST, READ ONLY
+        td = map_yaml(test_data_path, test_data_exclusion, config['environment'],
+                      config['test_data_cache'] if 'test_data_cache' in config else None)
         return td
 
     @staticmethod
@@ -200,6 +211,9 @@ class Core(object):
         """
             Gets the driver type based on the value in the configs TestRun->browser section. This comes from 
             the command line, if nothing is passed will use firefox, otherwise uses whatever follows the -b switch
+            When browser_reuse is set in the config, hands out a warm browser from the driver pool instead
+            When pipeline is set in the config, also launches the next test's browser in the background
+            When lazy_browser is set in the config, hands out a LazyDriver that only starts the browser on first use
             @param browser_type (string) - Browser type
             @param device_type (string) - device type
             @note Currently supports Firefox, Chrome, and IE. is called from the TestTemplate class in test_template.py
@@ -217,24 +231,45 @@ class Core(object):
         # SANITIZE
         browser_type = browser_type.lower()
         browser_type = 'firefox' if browser_type is None else browser_type
-        logger.info("Attempting to start the webdriver for %s" % browser_type)
         if self.driver_state:
             self.close_driver()
 
-        self.driver = Driver(browser_type, device_type)
+        if 'lazy_browser' in config and config['lazy_browser']:
+            logger.info("The webdriver for {} starts when the test first uses it".format(browser_type))
+            self.driver = LazyDriver(functools.partial(self.launch_driver, browser_type, device_type), browser_type)
+        else:
+            self.driver = self.launch_driver(browser_type, device_type)
         self.driver_state = True
+        return self.driver
+
+    @staticmethod
+    def launch_driver(browser_type, device_type=None):
+        """
+            Starts the browser, or takes a warm one from the driver pool, and puts the window in place
+            @param browser_type (string) - Browser type
+            @param device_type (string) - device type
+            @return Driver
+        """
+        logger.info("Attempting to start the webdriver for %s" % browser_type)
+        if pool.enabled(browser_type):
+            driver = pool.acquire(browser_type, device_type)
+            # START THE NEXT TEST'S BROWSER WHILE THIS TEST RUNS
+            if pool.pipeline() and ('tests_remaining' not in config or config['tests_remaining'] > 0):
+                pool.prefetch(browser_type, device_type, driver)
+        else:
+            driver = Driver(browser_type, device_type)
 
         if browser_type != 'ghost':
             x = config['window_x']
             y = config['window_y']
-            self.driver.set_window_position(x if x else 0, y if y else 0)
-            self.driver.set_window_size(1200, 1400)
-        return self.driver
+            driver.set_window_position(x if x else 0, y if y else 0)
+            driver.set_window_size(1200, 1400)
+        return driver
 
     @staticmethod
     def get_file_path(file_name=None, sanitize=None, start_directory=None):
         """
-            Finds file of the given file name using os walk
+            Finds file of the given file name in the asset index, or using os walk outside of the asset directories
             @param file_name (string) - The name of the file to find the path of
             @param sanitize (bool) - If set to False will not try to sanitize the file_name value
             @param start_directory (string) - If set will look in the Download folder instead of the Assets folder
@@ -242,24 +277,8 @@ class Core(object):
             from framework.core import Core
             Core.get_file_path("Survey 0001")
         """
-        if sanitize is False:
-            logger.debug("Skipping sanitation")
-            plain_name = file_name
-        else:
-            plain_name = re.sub(" (\[(\w{2,4}_)?[a-zA-Z0-9]{10}\])", "", file_name)
-            logger.info("Sanitized File Name: {}".format(plain_name))
-        file_path = None
-        import fnmatch
-        if start_directory is None:
-            start_directory = os.getcwd()
-        for root, _, file_names in os.walk(start_directory):
-            for filename in fnmatch.filter(file_names, plain_name):
-                file_path = os.path.join(root, filename)
-        if file_path is None:
-            logger.debug("Couldn't find {}".format(plain_name))
-        else:
-            logger.debug("File path: %s" % file_path)
-        return file_path
+        from library.helper import file_path
+        return file_path(file_name, sanitize, start_directory)
 
     @staticmethod
     def get_xml(file_name=None):
@@ -341,8 +360,13 @@ class Core(object):
                                                            tstruct.tm_year,
                                                            seconds)
         full_path = os.path.join(file_dir, ss_name)
+        if isinstance(self.driver, LazyDriver) and self.driver.launched is None:
+            logger.debug("The browser was never started, no screenshot to take")
+            return
         logger.debug("Writing screenshot to {}".format(full_path))
         self.driver.save_screenshot(full_path)
+        if 'screenshots' in config:
+            config['screenshots'].append(full_path)
 
     def timer(self, action):
         """
@@ -417,7 +441,7 @@ class Core(object):
 
     def write_result(self, result):
         """
-            Write the result of the test out to the xml output file
+            Write the result of the test out to the result stream of the run
             @param result (Result) - Result object
             @return None
             @note Writes out the name, title, notes (from docstring) and results of the test as xml elements
@@ -434,44 +458,66 @@ class Core(object):
             bug_url = config['bug_repo']
             if bug_url is None:
                 bug_url = "http://localhost"
-            test_result['bug'] = {'bug_text': bug, 'bug_link': os.path.join(bug_url, bug),
-                                  'bug_status': get_bug_status(bug)}
+            test_result['bug'] = {'bug_text': bug, 'bug_link': os.path.join(bug_url, bug)}
         test_result['duration'] = config['elapsed_time']
         test_result['result'] = result
+        test_result['attempt'] = config['attempt'] if 'attempt' in config else 1
+        test_result['steps'] = list(config['steps']) if 'steps' in config else []
         output_file = config['json_file_path']
         logger.debug("Output File Path: {}".format(output_file))
-        logger.debug("Checking if output file already exists")
-        # if os.path.exists(output_file):
-        #     logger.debug("Some results already collected, loading in results")
-        with open(output_file, 'r') as outfile:
-            other_results = json.load(outfile)
-        other_results['test_cases'].append(test_result)
-        with open(output_file, 'w') as outfile:
-            outfile.write(json.dumps(other_results, sort_keys=True, indent=4))
+        if pool.pipeline():
+            # THE BUG LOOKUP AND FILE WRITE HAPPEN IN THE BACKGROUND WHILE THE NEXT TEST STARTS
+            global result_writer
+            if result_writer is None:
+                result_writer = ThreadPoolExecutor(max_workers=1)
+            result_writer.submit(self.append_result, test_result, output_file).add_done_callback(log_failure)
+        else:
+            self.append_result(test_result, output_file)
+
+    @staticmethod
+    def append_result(test_result, output_file):
+        """
+            Adds the bug status of the test result if it is cached and appends it to the result stream of the run
+            @param test_result (dict) - The result built by write_result
+            @param output_file (string) - Path to the json result file of the run
+        """
+        if 'bug' in test_result:
+            # NEVER WAITS ON JIRA, A STATUS THAT ISN'T CACHED YET IS FILLED IN AT THE END OF THE RUN
+            resolver = get_resolver()
+            test_result['bug']['bug_status'] = resolver.cached(test_result['bug']['bug_text'])
+            resolver.request(test_result['bug']['bug_text'])
+        add_test(output_file, test_result)
+
+    @staticmethod
+    def flush_results():
+        """
+            Waits for any results still being written in the background
+        """
+        if result_writer is not None:
+            result_writer.submit(lambda: None).result()
+
+
+# WRITES RESULTS IN THE BACKGROUND WHEN THE PIPELINE IS ENABLED, ONE THREAD SO THEY STAY IN ORDER
+result_writer = None
+
+
+def log_failure(future):
+    """
+        Logs the exception of a background task, which would otherwise be lost
+        @param future (Future) - The finished task
+    """
+    if future.exception() is not None:
+        logger.error("Background task failed: {}".format(future.exception()))
+
 
 def get_bug_status(bug_id):
     """
         Gets the status of the bug, and if verify or closed, the fix version as well
         @param bug_id (string) - The id of the bug in Jira to get
         @return (string) - The status and the fix version (if present) as a string
+        @note Waits on Jira when the status isn't cached, write_result doesn't use this so a test never does
     """
-    url = "https://companyname.atlassian.net/rest/api/2/issue/{}".format(bug_id)
-    r = requests.get(url, auth=('apiuser', 'apipassword'), verify=False)
-    result = None
-    try:
-        status = r.json()['fields']['status']['name']
-        if status.lower() == 'verify' or status.lower() == 'closed':
-            fix_version = r.json()['fields']['fixVersions'][-1]['name']
-        else:
-            fix_version = None
-        result = "[{0}".format(status)
-        if fix_version is not None:
-            result += " - {0}]".format(fix_version)
-        else:
-            result += "]"
-    except Exception as e:
-        print(str(e))
-    return result
+    return get_resolver().resolve([bug_id])[bug_id]
 
 
 class APIBadStatus(Exception):
@@ -551,9 +597,14 @@ class BaseVerb(object):
                 #     logger.debug('Keyword {}: {}'.format(kw, new_kw[kw]))
 
             s = time()
-            ret = func(**new_kw)
-            logger.debug("verb dt: {} seconds".format(time() - s))
-            return ret
+            try:
+                return func(**new_kw)
+            finally:
+                dt = time() - s
+                logger.debug("verb dt: {} seconds".format(dt))
+                # STEP TIMINGS OF THE TEST FOR THE RUN HISTORY
+                if 'steps' in config:
+                    config['steps'].append([str_list, round(dt, 3)])
 
         return wrap
 
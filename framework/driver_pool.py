@@ -0,0 +1,195 @@
+## @package framework.driver_pool
+#  Keeps warm browsers around between tests so every test doesn't pay for a cold browser start. A browser handed
+#  back to the pool is scrubbed (alerts, extra windows, cookies, local and session storage) instead of quit, and
+#  is only quit once it fails a health check or has served browser_reuse tests.
+#  With pipeline set in the config, the browser for the next test is launched in the background while the current
+#  test runs, and browsers are quit in the background so tearDown doesn't wait on them.
+import atexit
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from library.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class DriverPool(object):
+    """
+        Pool of idle Driver objects keyed by browser and device type
+    """
+
+    def __init__(self):
+        self.idle = {}
+        self.spares = {}
+        self.launcher = None
+        self.closer = None
+
+    @staticmethod
+    def max_reuse():
+        """
+            @return (int) - How many tests a browser may serve before it is replaced, 0 disables the pool
+        """
+        config = Config()
+        return int(config['browser_reuse'] or 0) if 'browser_reuse' in config else 0
+
+    @staticmethod
+    def pipeline():
+        """
+            @return (bool) - True if browsers are launched and quit in the background
+        """
+        config = Config()
+        return bool(config['pipeline']) if 'pipeline' in config else False
+
+    def enabled(self, browser_type):
+        """
+            @param browser_type (string) - The browser type being asked for
+            @return (bool) - True if browsers of this type should come from the pool
+        """
+        return (self.max_reuse() > 0 or self.pipeline()) and browser_type != 'ghost'
+
+    def acquire(self, browser_type, device_type=None):
+        """
+            Hands out a healthy idle browser, or starts a new one if there is none
+            @param browser_type (string) - firefox, chrome, ie, mobile, vanilla
+            @param device_type (string) - iphone, ipad, ipod, android
+            @return Driver
+        """
+        idle = self.idle.setdefault((browser_type, device_type), [])
+        while idle:
+            driver = idle.pop()
+            if self.healthy(driver):
+                driver.use_count += 1
+                logger.info("Reusing warm {} browser ({} uses)".format(browser_type, driver.use_count))
+                return driver
+            logger.info("Discarding unhealthy {} browser".format(browser_type))
+            self.quit(driver)
+        spare = self.spares.pop((browser_type, device_type), None)
+        if spare is not None:
+            # ONLY BLOCKS IF THE BACKGROUND LAUNCH HAS NOT FINISHED YET
+            try:
+                driver = spare.result()
+                logger.info("Using {} browser launched in the background".format(browser_type))
+                return driver
+            except Exception as e:
+                logger.error("Background browser launch failed: {}".format(e))
+        return self.launch(browser_type, device_type)
+
+    @staticmethod
+    def launch(browser_type, device_type=None):
+        """
+            Starts a new browser that belongs to the pool
+            @param browser_type (string) - firefox, chrome, ie, mobile, vanilla
+            @param device_type (string) - iphone, ipad, ipod, android
+            @return Driver
+        """
+        from .driver import Driver
+        driver = Driver(browser_type, device_type)
+        driver.pool_key = (browser_type, device_type)
+        driver.use_count = 1
+        return driver
+
+    def prefetch(self, browser_type, device_type=None, current=None):
+        """
+            Launches the browser for the next test in the background, unless the current one will be reused for it
+            @param browser_type (string) - firefox, chrome, ie, mobile, vanilla
+            @param device_type (string) - iphone, ipad, ipod, android
+            @param current (Driver) - The browser the running test was handed
+        """
+        key = (browser_type, device_type)
+        if key in self.spares or self.idle.get(key):
+            return
+        if current is not None and current.use_count < self.max_reuse():
+            return
+        if self.launcher is None:
+            self.launcher = ThreadPoolExecutor(max_workers=1)
+        logger.debug("Launching the next {} browser in the background".format(browser_type))
+        self.spares[key] = self.launcher.submit(self.launch, browser_type, device_type)
+
+    def release(self, driver):
+        """
+            Resets the browser and puts it back in the pool, or quits it once it is worn out or broken
+            @param driver (Driver) - A driver handed out by acquire
+        """
+        if driver.use_count < self.max_reuse() and self.reset(driver):
+            self.idle.setdefault(driver.pool_key, []).append(driver)
+        elif self.pipeline():
+            if self.closer is None:
+                self.closer = ThreadPoolExecutor(max_workers=1)
+            self.closer.submit(self.quit, driver)
+        else:
+            self.quit(driver)
+
+    @staticmethod
+    def healthy(driver):
+        """
+            @param driver (Driver)
+            @return (bool) - True if the browser session still responds
+        """
+        try:
+            return len(driver.window_handles) > 0
+        except Exception as e:
+            logger.debug("Health check failed: {}".format(e))
+            return False
+
+    @staticmethod
+    def reset(driver):
+        """
+            Scrubs the state a test left behind in the browser
+            @param driver (Driver)
+            @return (bool) - False if the browser could not be reset and should be thrown away
+            @note Selenium can only delete the cookies of the current domain, chrome clears all of them through the
+                  devtools protocol
+        """
+        try:
+            try:
+                driver.switch_to.alert.dismiss()
+            except Exception:
+                pass
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.execute_script("window.localStorage.clear(); window.sessionStorage.clear();",
+                                  retry=False, silent=True)
+            driver.delete_all_cookies()
+            if driver.browser_type == 'chrome':
+                driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            driver.get('about:blank')
+            return True
+        except Exception as e:
+            logger.debug("Failed to reset browser: {}".format(e))
+            return False
+
+    @staticmethod
+    def quit(driver):
+        """
+            Closes the browser for good
+            @param driver (Driver)
+        """
+        try:
+            driver.close_driver()
+        except Exception as e:
+            logger.debug("Failed to close browser: {}".format(e))
+
+    def drain(self):
+        """
+            Quits every idle and spare browser and waits on the ones being quit in the background, called when the
+            process exits
+        """
+        for idle in self.idle.values():
+            while idle:
+                self.quit(idle.pop())
+        while self.spares:
+            _, spare = self.spares.popitem()
+            try:
+                self.quit(spare.result())
+            except Exception as e:
+                logger.debug("Background browser launch failed: {}".format(e))
+        if self.closer is not None:
+            self.closer.shutdown(wait=True)
+            self.closer = None
+
+
+pool = DriverPool()
+atexit.register(pool.drain)
@@ -0,0 +1,262 @@
+## @package framework.junit
+#  JUnit XML report of a run, written a <testcase> at a time as each test finishes. The file always ends with the
+#  closing </testsuite>, every new test case is written over it and puts it back, so a run that is killed part way
+#  through still leaves a report CI can read. Writes are made under an exclusive flock so workers and forked children
+#  can all add to the same report. The totals on <testsuite> are filled in once, when the run is finished.
+#
+#  Every attempt of a test is written as it finishes. When the run is finished only the last attempt of each test is
+#  kept as its <testcase>, the failures of the attempts before it become <flakyFailure> children when it passed in the
+#  end and <rerunFailure> children when it didn't, the way Maven Surefire reports re-runs. The totals then match the
+#  failures SLAP exits with.
+import logging
+import os
+import socket
+from time import strftime
+from xml.etree import ElementTree as ET
+
+from library.config import Config
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+HEADER = '<?xml version="1.0" encoding="utf-8"?>\n'
+CLOSE = b'</testsuite>\n'
+
+
+def suite_element(name, timestamp=None, **totals):
+    """
+        @param name (string) - Name of the suite, the run_id
+        @param timestamp (string) - When the run started, now by default
+        @param totals - tests, failures, errors, skipped and time of the suite once the run is finished
+        @return string - The opening <testsuite> tag on a line of its own
+    """
+    suite = ET.Element('testsuite', name=name, hostname=socket.gethostname(),
+                       timestamp=timestamp or strftime('%Y-%m-%dT%H:%M:%S'),
+                       **{key: str(value) for key, value in totals.items()})
+    return ET.tostring(suite, encoding='unicode').replace(' />', '>') + '\n'
+
+
+def start_report(path, name):
+    """
+        Starts an empty report, replacing any report already at the path
+        @param path (string) - Where to write the JUnit XML
+        @param name (string) - Name of the suite, the run_id
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'wb') as outfile:
+        outfile.write((HEADER + suite_element(name)).encode('utf-8'))
+        outfile.write(CLOSE)
+
+
+def testcase(name, classname, duration, status, message=None, details=None, properties=None, attachments=()):
+    """
+        Builds the <testcase> of a single test
+        @param name (string) - Name of the test
+        @param classname (string) - Module and class of the test
+        @param duration (float) - Seconds the test took
+        @param status (string) - passed, failed, error or skipped
+        @param message (string) - The failure, error or skip reason
+        @param details (string) - The traceback of a failure or error
+        @param properties (dict) - Extra values to record such as the attempt and bug
+        @param attachments (list) - Paths of the log and screenshots of the test
+        @return Element
+    """
+    case = ET.Element('testcase', name=name, classname=classname or '', time="{:.3f}".format(duration))
+    if properties:
+        props = ET.SubElement(case, 'properties')
+        for key, value in sorted(properties.items()):
+            ET.SubElement(props, 'property', name=key, value=str(value))
+    if status in ('failed', 'error'):
+        child = ET.SubElement(case, 'failure' if status == 'failed' else 'error',
+                              message=(message or '').strip().split('\n')[-1])
+        child.text = details or message
+    elif status == 'skipped':
+        ET.SubElement(case, 'skipped', message=message or '')
+    attachments = [path for path in attachments if path]
+    if attachments:
+        # THE FORMAT THE JENKINS AND GITLAB JUNIT PARSERS PICK ATTACHMENTS UP FROM
+        out = ET.SubElement(case, 'system-out')
+        out.text = '\n'.join('[[ATTACHMENT|{}]]'.format(path) for path in attachments)
+    return case
+
+
+def case_bytes(case):
+    """
+        @param case (Element) - A <testcase>
+        @return bytes - The test case indented under <testsuite>, on lines of its own
+    """
+    from framework.core import Core
+    Core().indent(case, 1)
+    case.tail = '\n'
+    return b'  ' + ET.tostring(case, encoding='utf-8').split(b'?>\n', 1)[-1]
+
+
+def add_testcase(path, case):
+    """
+        Writes a <testcase> over the closing tag of the report and puts the closing tag back after it
+        @param path (string) - The report started by start_report
+        @param case (Element) - Built by testcase
+    """
+    data = case_bytes(case) + CLOSE
+    with open(path, 'r+b') as outfile:
+        if fcntl is not None:
+            fcntl.flock(outfile.fileno(), fcntl.LOCK_EX)
+        outfile.seek(0, os.SEEK_END)
+        end = outfile.tell()
+        outfile.seek(max(end - len(CLOSE), 0))
+        if outfile.read() != CLOSE:
+            logger.warning("{} does not end with {}, adding to the end".format(path, CLOSE.strip()))
+            outfile.seek(end)
+        else:
+            outfile.seek(end - len(CLOSE))
+        outfile.write(data)
+        outfile.flush()
+        os.fsync(outfile.fileno())
+
+
+def record_test(path, test, test_result, duration, attachments=()):
+    """
+        Adds the outcome of a unittest run of a single test to the report
+        @param path (string) - The report started by start_report
+        @param test (string) - Name of the test
+        @param test_result (TestResult) - What unittest.TextTestRunner().run returned, None if the test was not found
+        @param duration (float) - Seconds the test took
+        @param attachments (list) - Paths of the log and screenshots of the test
+    """
+    from library.test_index import get_index
+    config = Config()
+    entry = get_index().find(test)
+    classname = "{}.{}".format(entry['module'], entry['cls']) if entry else ''
+    properties = {'attempt': config['attempt'] if 'attempt' in config else 1}
+    if 'bug' in config and config['bug']:
+        properties['bug'] = config['bug']
+    message = details = None
+    if test_result is None:
+        status, message = 'error', 'Test case [{}] was not found'.format(test)
+    elif test_result.failures:
+        status, details = 'failed', test_result.failures[0][1]
+        message = details
+    elif test_result.errors:
+        status, details = 'error', test_result.errors[0][1]
+        message = details
+    elif test_result.skipped:
+        status, message = 'skipped', test_result.skipped[0][1]
+    else:
+        status = 'passed'
+    add_testcase(path, testcase(test, classname, duration, status, message, details, properties, attachments))
+
+
+def record_skipped(path, test, reason):
+    """
+        Adds a test that was left out of the run to the report as skipped
+        @param path (string) - The report started by start_report
+        @param test (string) - Name of the test
+        @param reason (string) - Why it was skipped
+    """
+    from library.test_index import get_index
+    entry = get_index().find(test)
+    classname = "{}.{}".format(entry['module'], entry['cls']) if entry else ''
+    add_testcase(path, testcase(test, classname, 0.0, 'skipped', reason, properties={'attempt': 1}))
+
+
+def case_key(case):
+    """
+        @param case (Element) - A <testcase>
+        @return (tuple) - The classname and name of the test, the same for every attempt of it
+    """
+    return case.get('classname'), case.get('name')
+
+
+def attempt_of(case):
+    """
+        @param case (Element) - A <testcase> written by record_test or record_skipped
+        @return (int) - Which attempt of the test it is
+    """
+    for prop in case.iter('property'):
+        if prop.get('name') == 'attempt':
+            return int(prop.get('value'))
+    return 1
+
+
+def rerun_element(outcome, passed, output=None):
+    """
+        @param outcome (Element) - The <failure> or <error> of an earlier attempt
+        @param passed (bool) - Whether the last attempt of the test passed
+        @param output (Element) - The <system-out> of the earlier attempt, its log and screenshots
+        @return Element - <flakyFailure>, <flakyError>, <rerunFailure> or <rerunError>
+    """
+    tag = ('flaky' if passed else 'rerun') + ('Failure' if outcome.tag == 'failure' else 'Error')
+    child = ET.Element(tag, message=outcome.get('message', ''))
+    ET.SubElement(child, 'stackTrace').text = outcome.text
+    if output is not None:
+        ET.SubElement(child, 'system-out').text = output.text
+    return child
+
+
+def outcome_of(case):
+    """
+        @param case (Element) - A <testcase>
+        @return string - failure, error, skipped or None when it passed
+    """
+    for outcome in ('failure', 'error', 'skipped'):
+        if case.find(outcome) is not None:
+            return outcome
+    return None
+
+
+def finish_report(path):
+    """
+        Keeps only the last attempt of each test, with the failures of the attempts before it, and fills in the totals
+        of the suite. The test cases are read and written one at a time, only the failures of tests that were run
+        more than once are held on to
+        @param path (string) - The report started by start_report
+    """
+    # FIRST PASS, THE LAST ATTEMPT OF EVERY TEST AND THE FAILURES OF EVERY ATTEMPT
+    last = {}
+    failures = {}
+    for _, element in ET.iterparse(path):
+        if element.tag == 'testcase':
+            key, attempt, outcome = case_key(element), attempt_of(element), outcome_of(element)
+            if key not in last or attempt >= last[key][0]:
+                last[key] = (attempt, outcome, float(element.get('time') or 0))
+            if outcome in ('failure', 'error'):
+                failures.setdefault(key, []).append((attempt, element.find(outcome), element.find('system-out')))
+            element.clear()
+    totals = dict(tests=len(last), failures=0, errors=0, skipped=0)
+    for _, outcome, _ in last.values():
+        if outcome is not None:
+            totals[outcome if outcome == 'skipped' else outcome + 's'] += 1
+    totals['time'] = "{:.3f}".format(sum(seconds for _, _, seconds in last.values()))
+
+    with open(path, 'rb') as infile:
+        infile.readline()
+        # THE NAME AND TIMESTAMP THE REPORT WAS STARTED WITH, run_test PREFIXES THE run_id IN THE CONFIG
+        started = ET.fromstring(infile.readline().decode('utf-8') + '</testsuite>')
+    tmp_file = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_file, 'wb') as outfile:
+        outfile.write((HEADER + suite_element(started.get('name'), started.get('timestamp'), **totals)).encode('utf-8'))
+        for _, element in ET.iterparse(path):
+            if element.tag != 'testcase':
+                continue
+            key = case_key(element)
+            if attempt_of(element) < last[key][0]:
+                element.clear()
+                continue
+            passed = last[key][1] is None
+            earlier = sorted((x for x in failures.get(key, []) if x[0] < last[key][0]), key=lambda x: x[0])
+            # THE EARLIER ATTEMPTS GO BEFORE THE <system-out> OF THE LAST ONE
+            position = len(element) - (1 if element.find('system-out') is not None else 0)
+            for offset, (_, outcome, output) in enumerate(earlier):
+                element.insert(position + offset, rerun_element(outcome, passed, output))
+            outfile.write(case_bytes(element))
+            element.clear()
+        outfile.write(CLOSE)
+    os.replace(tmp_file, path)
+    logger.info("JUnit report: {tests} test_cases, {failures} failed, {errors} errors, {skipped} skipped".format(
+        **totals))
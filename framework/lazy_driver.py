@@ -0,0 +1,50 @@
+## @package framework.lazy_driver
+#  Stand in for a Driver that only starts the browser the first time something is done with it. With lazy_browser
+#  set in the config (or --lazy_browser), Core.get_driver hands out a LazyDriver, so a test that only calls APIs or
+#  sets up data never pays for a browser, and one that does gets its browser on the first verb that touches it.
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LazyDriver(object):
+    """
+        Proxy that launches the real Driver on first attribute access and forwards everything to it from then on
+    """
+
+    def __init__(self, launch, browser_type):
+        """
+            @param launch (function) - Starts and returns the real Driver, called at most once
+            @param browser_type (string) - The browser type that will be launched
+        """
+        object.__setattr__(self, '_launch', launch)
+        object.__setattr__(self, '_driver', None)
+        object.__setattr__(self, 'browser_type', browser_type)
+
+    @property
+    def launched(self):
+        """
+            @return Driver - The real driver, None if the browser was never needed
+        """
+        return object.__getattribute__(self, '_driver')
+
+    def target(self):
+        """
+            @return Driver - The real driver, launching the browser if this is the first use
+        """
+        driver = object.__getattribute__(self, '_driver')
+        if driver is None:
+            logger.info("First use of the {} browser, launching it".format(self.browser_type))
+            driver = object.__getattribute__(self, '_launch')()
+            object.__setattr__(self, '_driver', driver)
+        return driver
+
+    def __getattr__(self, item):
+        return getattr(self.target(), item)
+
+    def __setattr__(self, key, value):
+        setattr(self.target(), key, value)
+
+    def __repr__(self):
+        driver = self.launched
+        return "<LazyDriver {} {}>".format(self.browser_type, 'not launched' if driver is None else repr(driver))
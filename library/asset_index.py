@@ -0,0 +1,159 @@
+"""
+Index of the files under the asset directories (the Assets folder by default, asset_dirs in the config). file_path
+used to walk the whole living dir, output and download folders included, on every call, and every browser launch
+calls it for its extensions. The index walks the asset directories once per process, after which a lookup is a
+dictionary hit.
+
+A hit whose file is gone or a miss rebuilds the index once before giving up. With asset_watch set in the config and
+the optional inotify_simple package installed, changes under the asset directories mark the index stale as they
+happen instead.
+"""
+import fnmatch
+import logging
+import os
+import threading
+
+from library.config import Config
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+logger = logging.getLogger(__name__)
+
+# THE INDEX OF THIS PROCESS, BUILT BY get_asset_index
+_asset_index = None
+
+
+class AssetIndex(object):
+    """
+        File name to the paths of the files with that name under the asset directories
+    """
+
+    def __init__(self, roots):
+        """
+            @param roots (list) - The directories to index
+        """
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.names = {}
+        self.paths = []
+        self.stale = True
+        self.lock = threading.Lock()
+        self.watcher = None
+
+    def build(self):
+        """
+            Walks the asset directories, later paths win like they did with the os.walk in file_path
+        """
+        names = {}
+        paths = []
+        for root in self.roots:
+            for directory, _, file_names in os.walk(root):
+                for file_name in file_names:
+                    path = os.path.join(directory, file_name)
+                    names.setdefault(file_name, []).append(path)
+                    paths.append(path)
+        with self.lock:
+            self.names = names
+            self.paths = paths
+            self.stale = False
+        logger.debug("Indexed {} asset files under {}".format(len(paths), ", ".join(self.roots)))
+
+    def find(self, pattern):
+        """
+            @param pattern (string) - A file name, or a shell style pattern such as *.xpi
+            @return string - Path of the last file that matches, None if nothing does
+        """
+        if self.stale:
+            self.build()
+        path = self.match(pattern)
+        if path is not None and self.watcher is None and not os.path.isfile(path):
+            # THE FILE WAS MOVED OR DELETED SINCE THE INDEX WAS BUILT
+            path = None
+        if path is None and self.watcher is None:
+            self.build()
+            path = self.match(pattern)
+        return path
+
+    def match(self, pattern):
+        """
+            @param pattern (string) - A file name, or a shell style pattern
+            @return string - Path of the last indexed file that matches, None if nothing does
+        """
+        with self.lock:
+            if not any(c in pattern for c in '*?['):
+                found = self.names.get(pattern)
+                return found[-1] if found else None
+            for path in reversed(self.paths):
+                if fnmatch.fnmatch(os.path.basename(path), pattern):
+                    return path
+        return None
+
+    def covers(self, directory):
+        """
+            @param directory (string) - A directory
+            @return (bool) - True if the directory is one of the asset directories or inside one
+        """
+        directory = os.path.abspath(directory)
+        return any(directory == root or directory.startswith(root + os.sep) for root in self.roots)
+
+    def watch(self):
+        """
+            Marks the index stale whenever a file is added, removed or renamed under the asset directories
+            @return (bool) - False if inotify_simple is not installed
+        """
+        if INotify is None:
+            logger.warning("asset_watch is set but inotify_simple is not installed, checking assets on lookup")
+            return False
+        inotify = INotify()
+        mask = flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO | flags.DELETE_SELF
+        watches = {}
+
+        def add_watches(top):
+            for directory, _, _ in os.walk(top):
+                watches[inotify.add_watch(directory, mask)] = directory
+
+        for root in self.roots:
+            add_watches(root)
+
+        def read_events():
+            while True:
+                for event in inotify.read():
+                    self.stale = True
+                    # NEW DIRECTORIES NEED A WATCH OF THEIR OWN
+                    if event.mask & flags.ISDIR and event.mask & (flags.CREATE | flags.MOVED_TO) and \
+                            event.wd in watches:
+                        add_watches(os.path.join(watches[event.wd], event.name))
+
+        self.watcher = threading.Thread(target=read_events, daemon=True)
+        self.watcher.start()
+        return True
+
+
+def asset_roots():
+    """
+        @return (list) - The asset_dirs in the config, or the Assets folder of the living_dir
+    """
+    config = Config()
+    roots = config['asset_dirs'] if 'asset_dirs' in config else None
+    if not roots:
+        roots = [os.path.join(config['living_dir'] or os.getcwd(), 'Assets')]
+    elif isinstance(roots, str):
+        roots = [x.strip() for x in roots.split(',') if x.strip()]
+    return roots
+
+
+def get_asset_index():
+    """
+        Builds the index once per process
+        @return AssetIndex
+    """
+    global _asset_index
+    if _asset_index is None:
+        config = Config()
+        _asset_index = AssetIndex(asset_roots())
+        _asset_index.build()
+        if 'asset_watch' in config and config['asset_watch']:
+            _asset_index.watch()
+    return _asset_index
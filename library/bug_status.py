@@ -0,0 +1,250 @@
+"""
+Status of the Jira bugs tests are tagged with (@bug in the docstring). Writing the result of a test used to wait on a
+request to Jira for its bug, one request per test with no timeout. Now the result is written straight away with the
+status if it is already cached, and the bug is handed to a background thread that looks up every bug it has been
+given in one JQL search over a pooled session. At the end of the run the status of every bug in the results is
+filled in, from the cache or one more batched search, before the result file is assembled.
+
+Statuses are cached on disk (bug_cache_file in the config) for bug_cache_ttl seconds, so runs close together only ask
+Jira about bugs they haven't seen. bug_api points at the Jira REST api, a local stub serving /search works as well.
+"""
+import json
+import logging
+import os
+import threading
+from time import time
+
+from library.config import Config
+
+logger = logging.getLogger(__name__)
+
+# HOW MANY BUGS ARE LOOKED UP IN ONE JQL SEARCH
+BATCH_SIZE = 50
+
+# THE RESOLVER OF THIS PROCESS, STARTED BY get_resolver
+_resolver = None
+
+
+def format_status(fields):
+    """
+        @param fields (dict) - The fields of a Jira issue
+        @return string - [Status], or [Status - Fix Version] when the bug is in verify or closed
+    """
+    status = fields['status']['name']
+    fix_version = None
+    if status.lower() == 'verify' or status.lower() == 'closed':
+        fix_version = fields['fixVersions'][-1]['name'] if fields.get('fixVersions') else None
+    if fix_version is not None:
+        return "[{} - {}]".format(status, fix_version)
+    return "[{}]".format(status)
+
+
+class BugResolver(object):
+    """
+        Looks up bug statuses in batches on a background thread, keeping them in a cache on disk
+    """
+
+    def __init__(self, api, auth=None, verify=True, timeout=10, cache_file=None, ttl=3600):
+        """
+            @param api (string) - Base url of the Jira REST api
+            @param auth (tuple) - User and password, None for no auth
+            @param verify (bool) - Check the certificate of the Jira host
+            @param timeout (int) - Seconds to wait on Jira
+            @param cache_file (string) - Where the statuses are kept between runs, None to keep them in memory only
+            @param ttl (int) - Seconds a cached status is used for
+        """
+        self.api = api.rstrip('/')
+        self.auth = auth
+        self.verify = verify
+        self.timeout = timeout
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.cache = self.load_cache()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        # CLEAR WHILE THE BACKGROUND THREAD IS WAITING ON JIRA
+        self.idle = threading.Event()
+        self.idle.set()
+        self.session = None
+        self.worker = None
+
+    def load_cache(self):
+        """
+            @return (dict) - Bug id to its status and when it was looked up, from the cache file
+        """
+        if not self.cache_file or not os.path.isfile(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file, 'r') as infile:
+                return json.load(infile)
+        except (IOError, ValueError) as e:
+            logger.debug("Not using the bug cache {}: {}".format(self.cache_file, e))
+            return {}
+
+    def save_cache(self):
+        """
+            Writes the cache out, keeping what other processes of the run added since it was read
+        """
+        if not self.cache_file:
+            return
+        with self.lock:
+            cache = dict(self.cache)
+        on_disk = self.load_cache()
+        for bug_id, entry in on_disk.items():
+            if bug_id not in cache or cache[bug_id]['time'] < entry['time']:
+                cache[bug_id] = entry
+        tmp_file = "{}.{}.tmp".format(self.cache_file, os.getpid())
+        try:
+            with open(tmp_file, 'w') as outfile:
+                json.dump(cache, outfile)
+            os.replace(tmp_file, self.cache_file)
+        except (IOError, OSError) as e:
+            logger.warning("Could not save the bug cache to {}: {}".format(self.cache_file, e))
+
+    def cached(self, bug_id):
+        """
+            @param bug_id (string) - The id of the bug in Jira
+            @return string - The status if it was looked up less than ttl seconds ago, otherwise None
+        """
+        entry = self.cache.get(bug_id)
+        if entry is not None and time() - entry['time'] < self.ttl:
+            return entry['status']
+        return None
+
+    def request(self, bug_id):
+        """
+            Asks for the bug to be looked up in the background, returns straight away
+            @param bug_id (string) - The id of the bug in Jira
+        """
+        if self.cached(bug_id) is not None:
+            return
+        with self.lock:
+            self.pending.add(bug_id)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.work, daemon=True)
+                self.worker.start()
+        self.wake.set()
+
+    def work(self):
+        """
+            Background thread, looks up whatever bugs were requested since it last woke up
+        """
+        while True:
+            self.wake.wait()
+            self.wake.clear()
+            with self.lock:
+                bug_ids = sorted(self.pending)
+                self.pending.clear()
+                self.idle.clear()
+            try:
+                self.fetch(bug_ids)
+            except Exception as e:
+                logger.warning("Background bug status lookup failed: {}".format(e))
+            finally:
+                self.idle.set()
+
+    def resolve(self, bug_ids):
+        """
+            Gets the status of every bug, looking the ones that aren't cached up in batches and waiting for them
+            @param bug_ids (iterable) - Ids of bugs in Jira
+            @return (dict) - Bug id to its status, None for bugs that could not be looked up
+        """
+        bug_ids = sorted(set(bug_ids))
+        # LOOK UP WHAT THE BACKGROUND THREAD HASN'T STARTED ON HERE, AND LET IT FINISH WHAT IT HAS
+        with self.lock:
+            self.pending.difference_update(bug_ids)
+        self.idle.wait(self.timeout)
+        self.fetch([bug_id for bug_id in bug_ids if self.cached(bug_id) is None])
+        return {bug_id: self.cached(bug_id) for bug_id in bug_ids}
+
+    def fetch(self, bug_ids):
+        """
+            Looks the bugs up with one JQL search per batch and caches their statuses
+            @param bug_ids (list) - Ids of bugs in Jira
+        """
+        if not bug_ids:
+            return
+        for start in range(0, len(bug_ids), BATCH_SIZE):
+            batch = bug_ids[start:start + BATCH_SIZE]
+            try:
+                issues = self.search(batch)
+            except Exception as e:
+                if len(batch) == 1 or getattr(getattr(e, 'response', None), 'status_code', None) != 400:
+                    logger.warning("Could not look up the status of {}: {}".format(', '.join(batch), e))
+                    continue
+                # A JIRA THAT IGNORES validateQuery FAILS THE WHOLE SEARCH WHEN ONE OF THE KEYS DOESN'T EXIST
+                logger.debug("Looking up {} one at a time: {}".format(', '.join(batch), e))
+                issues = []
+                for bug_id in batch:
+                    try:
+                        issues += self.search([bug_id])
+                    except Exception as error:
+                        logger.warning("Could not look up the status of {}: {}".format(bug_id, error))
+            now = time()
+            with self.lock:
+                for issue in issues:
+                    try:
+                        self.cache[issue['key']] = {'status': format_status(issue['fields']), 'time': now}
+                    except (KeyError, TypeError) as e:
+                        logger.warning("Unexpected fields on {}: {}".format(issue.get('key'), e))
+            logger.debug("Looked up the status of {} bugs".format(len(issues)))
+        self.save_cache()
+
+    def search(self, bug_ids):
+        """
+            Runs one JQL search for the bugs
+            @param bug_ids (list) - Ids of bugs in Jira
+            @throws HTTPError - if Jira turned the search down, with a 400 when it doesn't know one of the bugs
+            @return (list) - The issues found, bugs Jira doesn't know are left out
+        """
+        response = self.get_session().get(
+            "{}/search".format(self.api), timeout=self.timeout,
+            params={'jql': 'key in ({})'.format(','.join(bug_ids)), 'fields': 'status,fixVersions',
+                    'maxResults': len(bug_ids), 'validateQuery': 'warn'})
+        response.raise_for_status()
+        return response.json().get('issues', [])
+
+    def get_session(self):
+        """
+            @return Session - Kept open so every lookup reuses the same connections
+        """
+        if self.session is None:
+            # ONLY NEEDED WHEN A TEST HAS A BUG, SO IT ISN'T PAID FOR ON EVERY START UP
+            import requests
+            self.session = requests.Session()
+            self.session.auth = self.auth
+            self.session.verify = self.verify
+        return self.session
+
+
+def get_resolver():
+    """
+        Starts the resolver once per process from the bug_api settings in the config
+        @return BugResolver
+    """
+    global _resolver
+    if _resolver is None:
+        config = Config()
+        auth = (config['bug_api_user'], config['bug_api_password']) if config['bug_api_user'] else None
+        _resolver = BugResolver(config['bug_api'], auth, config['bug_api_verify'], config['bug_api_timeout'],
+                                config['bug_cache_file'], config['bug_cache_ttl'])
+    return _resolver
+
+
+def backfill_bug_status(json_file):
+    """
+        Looks up the status of every bug in the results of the run that doesn't have one yet and adds them to the
+        result stream, where they are filled in when the result file is assembled
+        @param json_file (string) - Path to the Test_Results_<run_id>.json of the run
+        @return (dict) - Bug id to its status
+    """
+    from library.results import build_results, stream_file, add_bug_status
+    test_run = build_results(stream_file(json_file))
+    bug_ids = set(test_result['bug']['bug_text'] for test_result in test_run['test_cases']
+                  if test_result.get('bug') and test_result['bug'].get('bug_status') is None)
+    if not bug_ids:
+        return {}
+    statuses = get_resolver().resolve(bug_ids)
+    add_bug_status(json_file, statuses)
+    return statuses
@@ -82,4 +82,39 @@ class Config(object):
             config['error_code_exclusion'] = ''
         if config['test_case_file'] is None:
             config['test_case_file'] = os.path.join(config['living_dir'], "test_cases.yaml")
+        if config.get('browser_reuse') is None:
+            config['browser_reuse'] = 0
+        if config.get('pipeline') is None:
+            config['pipeline'] = False
+        if config.get('lazy_browser') is None:
+            config['lazy_browser'] = False
+        if config.get('bug_api') is None:
+            config['bug_api'] = 'https://companyname.atlassian.net/rest/api/2'
+        if config.get('bug_api_user') is None:
+            config['bug_api_user'] = 'apiuser'
+        if config.get('bug_api_password') is None:
+            config['bug_api_password'] = 'apipassword'
+        if config.get('bug_api_verify') is None:
+            config['bug_api_verify'] = False
+        if config.get('bug_api_timeout') is None:
+            config['bug_api_timeout'] = 10
+        if config.get('bug_cache_file') is None:
+            config['bug_cache_file'] = os.path.join(config.get('output_dir') or config['living_dir'], 'bug_cache.json')
+        if config.get('bug_cache_ttl') is None:
+            config['bug_cache_ttl'] = 3600
+        if config.get('history_db') is None:
+            config['history_db'] = None
+        if config.get('results_fsync') is None:
+            config['results_fsync'] = 'always'
+        if config.get('lease_file') is None:
+            config['lease_file'] = os.path.join(config.get('output_dir') or config['living_dir'], 'leases.db')
+        if config.get('lease_ttl') is None:
+            config['lease_ttl'] = 3600
+        if config.get('lease_wait') is None:
+            config['lease_wait'] = 300
+        if config.get('test_index_file') is None:
+            config['test_index_file'] = os.path.join(config.get('output_dir') or config['living_dir'], 'test_index.json')
+        if config.get('test_data_cache') is None:
+            config['test_data_cache'] = os.path.join(config.get('output_dir') or config['living_dir'],
+                                                     'test_data_cache.json')
         return config
@@ -0,0 +1,126 @@
+"""
+Catalog of the error messages in the error_code_dir. Tests fail an assertion with a code such as GOTO_0000, which is
+the first message under goto in the error yaml files. The catalog is loaded once per process into a table of every
+code, so a failing assertion is a dictionary lookup, and the codes the tests of a run use are checked against it
+before the run starts instead of blowing up when a test fails.
+"""
+import logging
+import os
+import re
+
+import yaml
+
+from library.config import Config
+
+logger = logging.getLogger(__name__)
+
+# A MESSAGE THAT IS AN ERROR CODE INSTEAD OF A SENTENCE, GOTO_0000
+CODE = re.compile(r'^([A-Za-z]+)_(\d+)$')
+
+# THE CATALOG OF THIS PROCESS, LOADED BY get_catalog
+_catalog = None
+
+
+class ErrorCatalog(object):
+    """
+        Every error code to its message
+    """
+
+    def __init__(self, directory, exclusion=None):
+        """
+            @param directory (string) - The directory holding the error yaml files
+            @param exclusion (list) - File names in the directory to leave out
+        """
+        self.directory = directory
+        self.exclusion = exclusion or []
+        self.codes = {}
+
+    def load(self):
+        """
+            Reads every error yaml file into the table of codes
+            @return ErrorCatalog - self
+        """
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('yaml') or filename in self.exclusion:
+                continue
+            with open(os.path.join(self.directory, filename), 'rb') as f:
+                errors = (yaml.safe_load(f) or {}).get('errors') or {}
+            for key, messages in errors.items():
+                for number, message in enumerate(messages or []):
+                    code = self.code(key, number)
+                    if code in self.codes:
+                        logger.warning("Error code {} in {} is defined more than once".format(code, filename))
+                    self.codes[code] = message
+        logger.debug("Loaded {} error codes".format(len(self.codes)))
+        return self
+
+    @staticmethod
+    def code(key, number):
+        """
+            @param key (string) - The group of the error, goto
+            @param number (int) - Position of the message in the group
+            @return string - GOTO_0000
+        """
+        return "{}_{:04}".format(key.upper(), int(number))
+
+    @staticmethod
+    def normalize(msg):
+        """
+            @param msg (string) - The message an assertion failed with
+            @return string - The message as a code in the form the table uses, None if it isn't a code
+        """
+        match = CODE.match(msg.strip()) if msg else None
+        return ErrorCatalog.code(match.group(1), match.group(2)) if match else None
+
+    def lookup(self, msg):
+        """
+            @param msg (string) - The message an assertion failed with, either a code or a message of its own
+            @return string - The message of the code, or msg itself if it isn't a known code
+        """
+        code = self.normalize(msg)
+        if code is None:
+            return msg
+        if code not in self.codes:
+            logger.warning("Unknown error code {}".format(msg))
+            return msg
+        return self.codes[code]
+
+    def unknown(self, codes):
+        """
+            @param codes (iterable) - Error codes
+            @return (list) - The ones that are not in the catalog
+        """
+        return sorted(set(code for code in codes if self.normalize(code) not in self.codes))
+
+
+def get_catalog():
+    """
+        Loads the catalog once per process from the error_code_dir in the config
+        @return ErrorCatalog
+    """
+    global _catalog
+    if _catalog is None:
+        config = Config()
+        exclusion = [x.strip() for x in (config['error_code_exclusion'] or '').split(',') if x.strip()]
+        _catalog = ErrorCatalog(config['error_code_dir'], exclusion).load()
+    return _catalog
+
+
+def check_error_codes(test_list):
+    """
+        Logs every error code used by the test_cases of a run that is missing from the catalog
+        @param test_list (list) - Names of the test_cases of the run
+        @return (dict) - Test name to the unknown codes it uses, for the tests that use any
+    """
+    from library.test_index import get_index
+    index = get_index()
+    catalog = get_catalog()
+    missing = {}
+    for test in test_list:
+        entry = index.find(test)
+        unknown = catalog.unknown(entry.get('codes', [])) if entry else []
+        if unknown:
+            missing[test] = unknown
+            logger.error("[{}] uses error codes missing from {}: {}".format(test, catalog.directory,
+                                                                          ", ".join(unknown)))
+    return missing
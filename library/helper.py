@@ -1,14 +1,18 @@
 import argparse
-import inspect
 import os
 import platform
 import re
 import socket
-import unittest
-import json
+import time
 import yaml
 import importlib
-from library.log import log_to_file
+from library.log import log_to_file, flush_logs
+from library.soak import soak_duration
+from library.test_index import get_index
+from library.asset_index import get_asset_index
+from library.results import start_run, add_test, add_final, assemble, load_results
+from library.history import record_current_run
+from library.bug_status import backfill_bug_status
 
 
 import logging
@@ -24,20 +28,36 @@ def find_tc(test_name):
         @param: test_name(string) - the name of the test case, such as 'test_0001'
         @param: config(Configuration Object) The config object to pass to the test case once found
         @return: Unit Test test case object
-        @note: will find the test case based on the name regardless of where in the test_cases package it's located
+        @note: will find the test case based on the name regardless of where in the test_cases package it's located,
+               looking it up in the test index instead of importing every module
     """
-    config = Config()
-    with open(config['test_case_file'], 'rb') as f:
-        tc_config = yaml.load(f)
+    entry = get_index().find(test_name)
+    if entry is None:
+        return None
+    module = importlib.import_module(entry['module'])
+    return getattr(module, entry['cls'])(test_name)
+
 
+def preload_tests():
+    """
+        Imports every test_case module listed in the test_case_file, parses the test data and indexes the assets, so a
+        daemon or fork server pays for it once instead of once per run or per test
+    """
+    from framework.core import Core
+    config = Config()
+    with open(config['test_case_file'], 'r') as f:
+        tc_config = yaml.safe_load(f)
+    count = 0
     for k, v in tc_config.items():
         for package in v:
-            module = importlib.import_module(f'test_cases.{k}.{package}')
-            for _, oj in inspect.getmembers(module):
-                if inspect.isclass(oj):
-                    if hasattr(oj, test_name):
-                        return oj(test_name)
-    return None
+            try:
+                importlib.import_module('test_cases.{}.{}'.format(k, package))
+                count += 1
+            except Exception as e:
+                logger.error("Failed to import test_cases.{}.{}: {}".format(k, package, e))
+    Core().get_test_data()
+    get_asset_index()
+    logger.info("Preloaded {} test_case modules".format(count))
 
 
 def find_staging(config):
@@ -51,9 +71,10 @@ def find_staging(config):
             return config.get('Staging', item.upper())
 
 
-def get_args():
+def get_args(argv=None):
     """
         Pulls the arguments off the commandline and parses using rules
+        @param argv (list) - If passed, parses these arguments instead of the commandline
         @return parser object
         @note all commandline options and tweaks must be done to this function.
     """
@@ -61,7 +82,8 @@ def get_args():
                                                  " a mix of Selenium and REST api calls")
     # Create a group to add options that are exclusive for each other
     # namely you can do -t or -f but not both
-    group = parser.add_mutually_exclusive_group(required=True)
+    # NOT REQUIRED WHEN PULLING FROM A --queue, CHECKED AFTER PARSING INSTEAD
+    group = parser.add_mutually_exclusive_group()
     parser.add_argument('-b', '--browser', default='firefox',
                         help='Select which browser to use for the test: [chrome, ie, firefox, custom_mobile]')
     parser.add_argument('-d', '--device_type',
@@ -78,11 +100,59 @@ def get_args():
     parser.add_argument('-l', '--log_level', type=int, default=-1,
                         help='Log level to print to console, 0 is debug, 1 is default '
                              '(info and error), 2 is just results')
+    parser.add_argument('--retries', default=0, type=int,
+                        help='Re-runs failed test_cases up to [x] more times in separate passes at the end of the run')
     parser.add_argument('--loop', default=1, type=int,
-                        help='Will loop [x] amount of times over the list of test_cases passed in')
+                        help='Will loop [x] amount of times over the list of test_cases passed in, reporting duration '
+                             'percentiles, throughput and failures per iteration')
+    parser.add_argument('--soak', type=soak_duration,
+                        help='Keeps looping over the test_cases for this long (3600, 90m, 24h) and reports duration '
+                             'percentiles, throughput and failures per iteration')
     parser.add_argument('--save_log', action='store_true',
                         help='enable logging the output to file (timestamp.log)')
     parser.add_argument('--agent', help="When specified will execute test_cases as if this agent")
+    parser.add_argument('--workers', default=1, type=int,
+                        help='Number of worker processes to fan the test_cases out over, each with its own browser')
+    parser.add_argument('--fork', nargs='?', const=1, default=0, type=int,
+                        help='Import the test_cases and test data once, then fork a fresh process for every [x] '
+                             'test_cases (default 1), combine with --workers to run that many at once')
+    parser.add_argument('--reuse_browser', type=int,
+                        help='Keep browsers warm between test_cases, replacing each one after it served this many tests')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Launch the next browser while a test runs, and quit browsers and write results '
+                             'in the background')
+    parser.add_argument('--junit',
+                        help='Write a JUnit XML report to this file, a test case at a time as each test finishes')
+    parser.add_argument('--lazy_browser', action='store_true',
+                        help='Only start the browser once a test first uses it, test_cases that never touch the browser '
+                             'never start one')
+    parser.add_argument('--queue',
+                        help='Path to a SQLite queue file shared by all agents. Any test_cases passed in with -t, -s, -f '
+                             'or -a are added to the queue, then this agent runs test_cases off the queue until it is empty')
+    parser.add_argument('--lease_timeout', default=600, type=int,
+                        help='Seconds before a test leased off the --queue by an agent that stopped responding '
+                             'is handed to another agent')
+    parser.add_argument('--plan', action='store_true',
+                        help="When set will print the estimated run time for --workers instead of running the test_cases")
+    parser.add_argument('--durations', nargs='+',
+                        help='Result files or directories of previous runs to read test durations from, '
+                             'defaults to the output_dir')
+    parser.add_argument('--shard', type=shard_arg,
+                        help='i/n, runs only the i-th of n slices of the test_cases, balanced on recorded durations')
+    parser.add_argument('--serve',
+                        help='Path of a unix socket to listen on, keeps the test_cases, test data and browsers loaded '
+                             'and runs the test_cases sent to it by slap.py --connect')
+    parser.add_argument('--connect',
+                        help='Path of the unix socket of a slap.py --serve daemon to send this run to')
+    parser.add_argument('--tags', type=lambda value: [x.strip() for x in value.split(',') if x.strip()],
+                        help='Comma separated tags (@arg), only runs the test_cases that have at least one of them')
+    parser.add_argument('--max_priority', '--max-priority', type=int,
+                        help='Only runs the test_cases with this priority (@attention or priority= note) or a more '
+                             'important one, test_cases without one count as 3')
+    parser.add_argument('--env_aware', '--env-aware', action='store_true',
+                        help='Leaves out the test_cases whose ENV= or ENV!= notes rule out the environment of the run')
+    parser.add_argument('--profile_startup', '--profile-startup', action='store_true',
+                        help='Runs the command with python -X importtime and reports the slowest imports at the end')
     parser.add_argument('--list', action='store_true',
                         help="When set will instead list all test_cases found. Only useful with -f, -s, or -a")
     # GROUP ARGUMENTS
@@ -95,12 +165,76 @@ def get_args():
                        help='Suite of test_cases in the Module name to run')
     group.add_argument('-t', '--test', nargs='+',
                        help='The test to run')
+    group.add_argument('--rerun_failed', '--rerun-failed',
+                       help='A Test_Results_<run_id>.json file of a previous run, runs only the tests that failed in it')
 
     try:
-        return parser.parse_args()
+        args = parser.parse_args(argv)
+        if not (args.all or args.file or args.suite or args.test or args.rerun_failed or args.queue or args.serve):
+            parser.error("one of the arguments -a/--all -f/--file -s/--suite -t/--test --rerun_failed --queue "
+                         "--serve is required")
     except:
         # parser.print_help()
         exit()
+    if args.queue and (args.loop > 1 or args.soak):
+        # THE FIRST ITERATION DRAINS THE QUEUE, EVERY OTHER ONE WOULD FIND IT EMPTY. CHECKED OUTSIDE THE TRY SO IT EXITS NON ZERO
+        parser.error("--queue can't be combined with --loop or --soak")
+    return args
+
+
+def shard_arg(value):
+    """
+        Parses the --shard argument
+        @param value (string) - i/n, such as 2/4
+        @return (tuple) - (i, n)
+    """
+    match = re.match(r'^(\d+)/(\d+)$', value)
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise argparse.ArgumentTypeError("expected i/n with 1 <= i <= n, got '{}'".format(value))
+    return int(match.group(1)), int(match.group(2))
+
+
+def get_test_list(args):
+    """
+        Figures out what kind of test was passed in and builds the list of test_cases from it, narrowed down by the
+        selection flags (--tags, --max_priority, --env_aware). set_env must be called first
+        @param args (Namespace) - The parsed arguments
+        @return (list) - Names of the test_cases
+    """
+    test_list = []
+    if args.test:
+        test_list = args.test
+    elif args.file:
+        # Populate the entries in the file into a list (array)
+        for line in args.file:
+            test_list.append(line.strip())
+        args.file.close()
+    elif args.suite:
+        for module in args.suite:
+            test_list += get_tc_list(module)
+    elif args.all:
+        for project in args.all:
+            test_list += get_all_list(project)
+    elif args.rerun_failed:
+        test_list = get_failed_list(args.rerun_failed)
+    if args.tags or args.max_priority is not None or args.env_aware:
+        config = Config()
+        test_list = get_index().select(test_list, args.tags, args.max_priority,
+                                       config['environment'] if args.env_aware else None)
+    return test_list
+
+
+def get_time_stamp():
+    """
+        Creates the time stamp used in the names of the log files and saved log folder
+        @return string - month_day_year seconds_since_midnight
+    """
+    tstruct = time.localtime()
+    seconds = tstruct.tm_hour * 3600 + tstruct.tm_min * 60 + tstruct.tm_sec
+    return "{:02}_{:02}_{:02} {}".format(tstruct.tm_mon,
+                                         tstruct.tm_mday,
+                                         tstruct.tm_year,
+                                         seconds)
 
 
 def get_os_info():
@@ -133,65 +267,47 @@ def get_os_info():
 def get_tc_list(module_name):
     """
         Returns a list of test cases names (strings) to be executed by calling find_tc
-        @param module_name (string) - The module (dot py file)  to pull all the test_cases from
+        @param module_name (string) - The module (dot py file) to pull all the test_cases from, such as ti_login or
+               the_internet.ti_login
         @return tc_list (string List)
     """
-    # LOADING THE TC CONFIG
-    config = Config()
-    tc_list = list()
     # REGEX TO FIND TEST CASES IN THE TEST CLASS
-    comp = re.compile("(test_)([a-z_0-9]+?)(\d{4}$)")
-    tmp_list = module_name.split('_')
-    # CONVERT THE MODULE NAME TO CLASS NAME, MUST FOLLOW THIS FORMAT
-    class_name = tmp_list[0].upper() + tmp_list[1][0].upper() + tmp_list[1][1:]
-    # LOAD THE TEST CASE YAML
-    with open(config['test_case_file'], 'rb') as f:
-        test_case_config = yaml.load(f)
-
-    # FIND THE PARENT MODULE THAT HAS THE TEST SUITE MODULE
-    for m_name in test_case_config:
-        if module_name in test_case_config[m_name]:
-            # THIS IS THE RIGHT MODULE THAT WE ARE LOOKING FOR SO IMPORT THE SUB MODULE
-            idx = test_case_config[m_name].index(module_name)
-            module = importlib.import_module(f"test_cases.{m_name}.{test_case_config[m_name][idx]}")
-            test_class = getattr(module, class_name)
-            for name in test_class.__dict__:
-                if comp.match(name):
-                    tc_list.append(name)
-            #tc_list.append(tmp_data)
+    comp = re.compile(r"(test_)([a-z_0-9]+?)(\d{4}$)")
+    index = get_index()
+    tc_list = [test for test in index.ordered()
+               if ('.' + index.tests[test]['module']).endswith('.' + module_name) and comp.match(test)]
+    if not tc_list:
+        logger.warning("No test_cases found in suite [{}]".format(module_name))
     return tc_list
 
 
 def get_all_list(project=None):
     """
-        Returns a list of all test cases found in the project 
-        @param project (string) - If set will only return the test cases for that project (ts, rep, rs, ta) 
-        @return (list of strings) - Returns a list of Testcase names found by parsing through the modules
+        Returns a list of all test cases found in the project
+        @param project (string) - If set will only return the test cases for that project, either the prefix of the
+               test names (ti, toi) or the package under test_cases (the_internet), all returns every test case
+        @return (list of strings) - Returns a list of Testcase names found in the test index
     """
-    # GET A COPY OF GLOBALS TO WORK WITH
-    g = globals().copy()
-    tc_list = []
-    comp1 = re.compile("(test)(?P<project>_\w+?_)([a-z_]+?)(\d{4}$)")
-    comp2 = re.compile("(test)(_%s_)([a-z_]+?)(\d{4}$)" % project)
+    comp1 = re.compile(r"(test)(?P<project>_\w+?_)([a-z_]+?)(\d{4}$)")
+    comp2 = re.compile(r"(test)(_%s_)([a-z_]+?)(\d{4}$)" % project)
     # IF project == all SET TO NONE
-    project = None if project == 'all' else 'test_%s_' % project
-    for val in g:
-        for _, obj in inspect.getmembers(g[val]):
-            if inspect.isclass(obj):
-                for key in obj.__dict__:
-                    # USE SOME REGEX TO SEE IF THIS IS THE RIGHT MODULE NAME
-                    if project and comp2.match(key):
-                        tc_list.append(key)
-                    elif not project and comp1.match(key):
-                        tc_list.append(key)
+    project = None if project in (None, 'all') else project
+    index = get_index()
+    tc_list = []
+    for test in index.ordered():
+        if not project and comp1.match(test):
+            tc_list.append(test)
+        elif project and (comp2.match(test) or
+                          (index.tests[test]['module'].split('.')[1] == project and comp1.match(test))):
+            tc_list.append(test)
     return tc_list
 
 
 def get_test_metadata(test_list):
     """
-
-    :param test_list:
-    :return:
+        Builds the metadata of each test out of the test index, for exporting to a test case management tool
+        @param test_list (list) - Names of the test_cases
+        @return (list) - A dictionary of metadata per test, more than one for tests whose note is a dictionary
     """
     config = Config()
     metadata_list = list()
@@ -201,12 +317,12 @@ def get_test_metadata(test_list):
         test_name = test_name.replace("test_", "")
         full_test_name = 'test_' + test_name if test_name[:5] != 'test_' else test_name
 
-        test_object = find_tc(full_test_name)
-        assert test_object, "Failed to find any test case named '{}'".format(test_name)
+        entry = get_index().find(full_test_name)
+        assert entry, "Failed to find any test case named '{}'".format(test_name)
         test_id_list = re.findall("test_([a-zA-Z_]+?\d{4})", full_test_name)
         assert len(test_id_list) == 1, "Test name does not follow pattern"
-        # GET THE DOC STRING INTO A DICTIONARY
-        doc_dict = test_object.doc_dict
+        # THE DOC STRING WAS PARSED INTO A DICTIONARY WHEN THE TEST WAS INDEXED
+        doc_dict = entry['doc']
         test_cases = {"": ""}
         try:
             if 'note' in doc_dict and type(eval(doc_dict['note'])) is dict:
@@ -215,13 +331,11 @@ def get_test_metadata(test_list):
             print("Note is not a dictionary")
 
         # MAKE A TESTCASE FOR EACH TEST IF A DICTIONARY IS ADDED
-        for key, val in test_cases.iteritems():
-            test_metadata = test_object.doc_dict.copy()
+        for key, val in test_cases.items():
+            test_metadata = doc_dict.copy()
             test_metadata['name'] = "{}{}".format(test_metadata['title'], " %s" % key if key else "")
             test_metadata['script_id'] = "{}{}".format(test_name, " %s" % val if val else "")
-            comp = re.compile("# (.+)\n")
-            test_metadata['steps'] = [x.capitalize().replace('"', '') for x in
-                                      (comp.findall(inspect.getsource(getattr(test_object, full_test_name))))]
+            test_metadata['steps'] = list(entry['steps'])
             if 'priority' not in test_metadata:
                 test_metadata['priority'] = 3
             if 'result' not in test_metadata:
@@ -230,75 +344,226 @@ def get_test_metadata(test_list):
     return metadata_list
 
 
-def run_tests(test_list, time_stamp):
+def run_test(test, time_stamp):
+    """
+        Finds and runs a single test case, writing its log out to its own file
+        @param test: The name of the test case to run
+        @param time_stamp: The time stamp used in the name of the log file
+        @return (string) - Passed, Failed, Skipped or Not Found
+    """
+    config = Config()
+    comp = re.compile('(?:\w+?)_(\w+?)_(?:.+)')
+    # CREATE LOGFILE
+    # NEED TO WRITE A NEW LOG FILE PER TEST, THE LOGGER DOESN'T SUPPORT THIS
+    config['log_file'] = "LOG_{} {}.log".format(test, time_stamp)
+    full_path = os.path.join(config['log_dir'], config['log_file'])
+    log_to_file(full_path, logger, config['run_id'])
+    logger.debug("Hostname: {}".format(config['hostname']))
+    if type(test) != dict:
+        if not test.startswith('test_'):
+            test = 'test_{}'.format(test)
+    config['testname'] = test
+    # GET TEST PROJECT
+    project_name = comp.findall(test)
+    if len(project_name) == 1:
+        logger.debug("Project Name: {}".format(project_name[0]))
+        # SET UNIQUE VALUE IN CONFIG
+        config['run_id'] = "{}_{}".format(project_name[0], config['run_id'])
+    else:
+        logger.debug("Project Name not found: {}".format(test))
+    # Create the test case object after finding it in the test_cases package
+    junit_file = config['junit_file'] if 'junit_file' in config else None
+    tc = find_tc(test)
+    if tc is None:
+        logger.error('Test case [{}] was not found'.format(test))
+        if junit_file:
+            from framework.junit import record_test
+            record_test(junit_file, test, None, 0.0)
+        return 'Not Found'
+    import unittest
+    from library.leases import release_leases
+    # SCREENSHOTS TAKEN BY THE TEST ARE ATTACHED TO ITS TEST CASE IN THE JUNIT REPORT
+    config['screenshots'] = []
+    config['steps'] = []
+    start = time.time()
+    # WRITE OUT PERTINENT DATA FOR NOTIFICATION
+    try:
+        test_result = unittest.TextTestRunner().run(tc)
+    finally:
+        # HAND THE ACCOUNTS THE TEST LEASED TO THE NEXT TEST
+        release_leases()
+    logger.debug("\nTestResult: {}".format(test_result))
+    if junit_file:
+        from framework.junit import record_test
+        record_test(junit_file, test, test_result, time.time() - start, [full_path] + config['screenshots'])
+    if (len(test_result.failures) > 0) or (len(test_result.errors) > 0):
+        return 'Failed'
+    # THE TEST CALLED skipTest, THE SAME STATUS skip_tests GIVES A TEST IT LEAVES OUT
+    if len(test_result.skipped) > 0:
+        return 'Skipped'
+    return 'Passed'
+
+
+def run_tests(test_list, time_stamp, results=None, on_result=None):
     """
         Runs all the test_cases in the list and updates all values
         @param test_list: List of test_cases to run
         @param time_stamp: I'm sure it's used for something
+        @param results: If passed, filled with the status of each test by name
+        @param on_result: If passed, called with the name, status and duration in seconds of each finished test
         @return:
     """
-
     config = Config()
     # PARAMETERS
     fail_count = 0
     fail_array = ""
-    fail_padding_left = ""
-    fail_padding_right = ""
     count = 0
-    comp = re.compile('(?:\w+?)_(\w+?)_(?:.+)')
 
     # TEST LOOP
     for test in test_list:
-        # CREATE LOGFILE
-        # NEED TO WRITE A NEW LOG FILE PER TEST, THE LOGGER DOESN'T SUPPORT THIS
-        config['log_file'] = "LOG_{} {}.log".format(test, time_stamp)
-        full_path = os.path.join(config['log_dir'], config['log_file'])
-        log_to_file(full_path, logger, config['run_id'])
-        logger.debug("Hostname: {}".format(config['hostname']))
         count += 1
-        if type(test) != dict:
-            if not test.startswith('test_'):
-                test = 'test_{}'.format(test)
-        config['testname'] = test
-        # GET TEST PROJECT
-        project_name = comp.findall(test)
-        if len(project_name) == 1:
-            logger.debug("Project Name: {}".format(project_name[0]))
-            # SET UNIQUE VALUE IN CONFIG
-            config['run_id'] = "{}_{}".format(project_name[0], config['run_id'])
-        else:
-            logger.debug("Project Name not found: {}".format(test))
-        # Create the test case object after finding it in the test_cases package
-        tc = find_tc(test)
-        # get_test_metadata(tc, test)
-        if tc is not None:
-            # WRITE OUT PERTINENT DATA FOR NOTIFICATION
-            test_result = unittest.TextTestRunner().run(tc)
-            logger.debug("\nTestResult: {}".format(test_result))
-            if (len(test_result.failures) > 0) or (len(test_result.errors) > 0):
-                fail_count += 1
-                status = 'Failed'
-                if fail_array == "":
-                    fail_array = test
-                else:
-                    fail_array += " " + test
-            else:
-                status = 'Passed'
-            logger.info("TEST {1}/{2}: {0}: {3}".format(test, count, len(test_list), status))
-            if fail_array != "":
-                fail_padding_left = " ("
-                fail_padding_right = ")"
-            logger.info("TOTAL FAILURES: {}{}{}{}".format(fail_count,
-                                                          fail_padding_left,
-                                                          fail_array,
-                                                          fail_padding_right))
-        else:
-            logger.error('Test case [{}] was not found'.format(test))
+        # LETS THE PIPELINE KNOW IF IT SHOULD START A BROWSER FOR A NEXT TEST
+        config['tests_remaining'] = len(test_list) - count
+        start = time.time()
+        status = run_test(test, time_stamp)
+        if results is not None:
+            results[test] = status
+        if on_result is not None:
+            on_result(test, status, time.time() - start)
+        if status not in ('Passed', 'Skipped'):
             fail_count += 1
-            # logger.disable_log()
+            fail_array = test if fail_array == "" else "{} {}".format(fail_array, test)
+        if status != 'Not Found':
+            log_progress(test, count, len(test_list), status, fail_count, fail_array)
     return fail_count
 
 
+def rerun_failures(results, time_stamp, retries, workers=1, level=1, on_result=None, fork=0):
+    """
+        Re-runs the failed test_cases in separate passes at the end of the run, until they pass or run out of retries
+        @param results (dict) - The status of each test of the run by name, updated with the status of the re-runs
+        @param time_stamp (string) - The time stamp of the run
+        @param retries (int) - How many more times a failed test may be run
+        @param workers (int) - Number of worker processes to re-run the failures with
+        @param level (int) - The log level to use for the console of each worker
+        @param on_result (function) - If passed, called with the name, status and duration of each re-run
+        @param fork (int) - If set, re-runs the failures in forked processes of this many test_cases each
+        @return (dict) - How many times each test was run by name
+    """
+    from library.parallel import run_parallel
+    from library.zygote import run_forked
+    config = Config()
+    attempts = dict.fromkeys(results, 1)
+    for attempt in range(2, retries + 2):
+        # A TEST THAT WAS NOT FOUND WON'T BE FOUND THE SECOND TIME EITHER
+        failed = [test for test, status in results.items() if status == 'Failed']
+        if not failed:
+            break
+        logger.info("Re-running {} failed test_cases, attempt {} of {}".format(len(failed), attempt, retries + 1))
+        config['attempt'] = attempt
+        if fork:
+            run_forked(failed, time_stamp, fork, workers, results, on_result)
+        elif workers > 1:
+            run_parallel(failed, time_stamp, workers, level, results, on_result)
+        else:
+            run_tests(failed, time_stamp, results, on_result)
+        for test in failed:
+            attempts[test] = attempt
+    config['attempt'] = 1
+    return attempts
+
+
+def write_final_results(results, attempts):
+    """
+        Records the final status and attempt count of every test in the result file of the run
+        @param results (dict) - The final status of each test by name
+        @param attempts (dict) - How many times each test was run by name
+    """
+    config = Config()
+    output_file = config['json_file_path']
+    final_results = {}
+    for test, status in results.items():
+        name = test if test.startswith('test_') else 'test_{}'.format(test)
+        final_results[name] = {'result': status.lower(), 'attempts': attempts.get(test, 1)}
+    add_final(output_file, final_results)
+    backfill_bug_status(output_file)
+    # THE ONLY TIME THE WHOLE RESULT FILE IS WRITTEN
+    test_run = assemble(output_file)
+    record_current_run(test_run)
+
+
+def skip_tests(test_list):
+    """
+        Takes the test_cases that would skip themselves (deprecated, a newer driver_version, ENV= or ENV!= ruling out
+        the environment) out of the run and records them as skipped, so no browser is launched for them
+        @param test_list (list) - Names of the test_cases of the run
+        @return (tuple) - The test_cases to run, and a dict of the skipped ones to the status Skipped
+    """
+    config = Config()
+    to_run, skipped = get_index().skipped(test_list, config['environment'] or '',
+                                          config['driver_version'] if 'driver_version' in config else None)
+    if not skipped:
+        return to_run, {}
+    output_file = config['json_file_path']
+    for test, reason in skipped.items():
+        doc = get_index().find(test)['doc']
+        add_test(output_file, {'name': doc['name'], 'title': doc['title'], 'description': doc.get('test', ''),
+                               'duration': 0, 'result': 'skipped', 'skip_reason': reason, 'attempt': 1})
+        if 'junit_file' in config and config['junit_file']:
+            from framework.junit import record_skipped
+            record_skipped(config['junit_file'], doc['name'], reason)
+    return to_run, dict.fromkeys(skipped, 'Skipped')
+
+
+def get_failed_list(result_file):
+    """
+        Reads the test_cases that failed out of the result file of a previous run
+        @param result_file (string) - Path to a Test_Results_<run_id>.json file, or the .jsonl stream of a run that
+        never finished
+        @return (list) - Names of the failed test_cases
+    """
+    test_run = load_results(result_file)
+    if 'final_results' in test_run:
+        return sorted(name for name, final in test_run['final_results'].items()
+                      if final['result'] not in ('passed', 'skipped'))
+    failed = []
+    for test_result in test_run['test_cases']:
+        if test_result['result'] == 'failed' and test_result['name'] not in failed:
+            failed.append(test_result['name'])
+    return failed
+
+
+def finish_run():
+    """
+        Waits on the results and logs still being written in the background and quits any browsers left in the driver
+        pool
+    """
+    from framework.core import Core
+    from framework.driver_pool import pool
+    Core.flush_results()
+    pool.drain()
+    flush_logs()
+
+
+def log_progress(test, count, total, status, fail_count, fail_array):
+    """
+        Logs the status of a finished test along with the running failure total
+        @param test (string) - Name of the test that finished
+        @param count (int) - How many tests have finished so far
+        @param total (int) - How many tests are in the run
+        @param status (string) - Passed or Failed
+        @param fail_count (int) - Number of failures so far
+        @param fail_array (string) - Space separated names of the failed tests
+    """
+    logger.info("TEST {1}/{2}: {0}: {3}".format(test, count, total, status))
+    fail_padding_left = " (" if fail_array != "" else ""
+    fail_padding_right = ")" if fail_array != "" else ""
+    logger.info("TOTAL FAILURES: {}{}{}{}".format(fail_count,
+                                                  fail_padding_left,
+                                                  fail_array,
+                                                  fail_padding_right))
+
+
 def set_env(args, config):
     """
         Sets the datacenters for the test automation to run in, checking for an agent flag or config value. If found
@@ -326,27 +591,36 @@ def set_env(args, config):
 
 def file_path(file_name=None, sanitize=None, start_directory=None):
     """
-        Finds file of the given file name using os walk
+        Finds file of the given file name, looking it up in the asset index or walking the start_directory
         @param file_name (string) - The name of the file to find the path of
         @param sanitize (bool) - If set to False will not try to sanitize the file_name value
         @param start_directory (string) - If set will look in the Download folder instead of the Assets folder
         @par EXAMPLE
         from framework.core import Core
         Core.get_file_path("Survey 0001")
+        @note Files under the asset_dirs are found in the index, anything else (downloads) is still found with os.walk
     """
     if sanitize is False:
         logger.debug("Skipping sanitation")
         plain_name = file_name
     else:
-        plain_name = re.sub(" (\[(\w{2,4}_)?[a-zA-Z0-9]{10}\])", "", file_name)
+        plain_name = re.sub(r" (\[(\w{2,4}_)?[a-zA-Z0-9]{10}\])", "", file_name)
         logger.info("Sanitized File Name: {}".format(plain_name))
     file_path = None
-    import fnmatch
-    if start_directory is None:
-        start_directory = os.getcwd()
-    for root, _, file_names in os.walk(start_directory):
-        for filename in fnmatch.filter(file_names, plain_name):
-            file_path = os.path.join(root, filename)
+    index = get_asset_index()
+    if start_directory is None or index.covers(start_directory):
+        file_path = index.find(plain_name)
+        if file_path is not None and start_directory is not None and \
+                not os.path.abspath(file_path).startswith(os.path.abspath(start_directory) + os.sep):
+            file_path = None
+    if file_path is None:
+        import fnmatch
+        if start_directory is None:
+            start_directory = os.getcwd()
+        logger.debug("{} is not in the asset index, searching {}".format(plain_name, start_directory))
+        for root, _, file_names in os.walk(start_directory):
+            for filename in fnmatch.filter(file_names, plain_name):
+                file_path = os.path.join(root, filename)
     if file_path is None:
         logger.debug("Couldn't find {}".format(plain_name))
     else:
@@ -379,9 +653,8 @@ def create_json_info():
     test_run_dict['browser'] = config['browser']
     test_run_dict['dist'] = config['dist']
     test_run_dict['ip'] = config['ip']
-    test_run_dict['test_cases'] = []
+    test_run_dict['start_time'] = time.time()
 
     if not os.path.exists(config['output_dir']):
         os.mkdir(config['output_dir'])
-    with open(output_file, 'w') as outfile:
-        outfile.write(json.dumps(test_run_dict, sort_keys=True, indent=4))
+    start_run(output_file, test_run_dict)
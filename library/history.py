@@ -0,0 +1,279 @@
+"""
+SQLite store of the results of every run. The current folder of the output_dir is wiped at the start of each run, so
+the result files alone keep no history. With history_db set in the config, every run adds itself to the store once it
+is finished: the run, every attempt of every test with its result and duration, and how long each verb of the attempt
+took. The scheduler reads the recent durations of each test from here instead of walking old result files.
+
+Queries for the schedulers and reports:
+
+    python -m library.history --db history.db durations test_ti_login_0001 -n 5
+    python -m library.history --db history.db failure_rate --days 7
+    python -m library.history --db history.db flaky
+    python -m library.history --db history.db runs -n 10
+    python -m library.history --db history.db import output/current/Test_Results_e17c.json
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+from time import time
+
+from library.config import Config
+from library.results import load_results
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    host TEXT,
+    browser TEXT,
+    environment TEXT,
+    started REAL,
+    finished REAL NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS tests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    suite TEXT
+);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run INTEGER NOT NULL REFERENCES runs (id),
+    test INTEGER NOT NULL REFERENCES tests (id),
+    attempt INTEGER NOT NULL DEFAULT 1,
+    result TEXT NOT NULL,
+    duration REAL
+);
+CREATE TABLE IF NOT EXISTS step_timings (
+    attempt INTEGER NOT NULL REFERENCES attempts (id),
+    position INTEGER NOT NULL,
+    step TEXT NOT NULL,
+    duration REAL NOT NULL,
+    PRIMARY KEY (attempt, position)
+);
+CREATE INDEX IF NOT EXISTS runs_finished ON runs (finished);
+CREATE INDEX IF NOT EXISTS tests_suite ON tests (suite);
+-- LAST N DURATIONS OF A TEST, NEWEST FIRST, WITHOUT TOUCHING THE TABLE
+CREATE INDEX IF NOT EXISTS attempts_test ON attempts (test, id DESC, result, duration);
+-- FAILURE RATE BY SUITE OVER THE RUNS OF A TIME WINDOW
+CREATE INDEX IF NOT EXISTS attempts_run ON attempts (run, test, result);
+"""
+
+# test_ti_login_0001 IS IN THE SUITE ti_login WHEN THE TEST INDEX DOESN'T KNOW IT
+SUITE = re.compile(r'^test_(\w+?)_\d+$')
+
+
+class History(object):
+    """
+        The results of every run, stored in a SQLite file
+    """
+
+    def __init__(self, path):
+        """
+            @param path (string) - Path to the SQLite file, created if it does not exist
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=60)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def test_id(self, name):
+        """
+            @param name (string) - Name of a test
+            @return (int) - Its id, adding the test the first time it is seen
+        """
+        row = self.conn.execute("SELECT id FROM tests WHERE name = ?", (name,)).fetchone()
+        if row is not None:
+            return row[0]
+        return self.conn.execute("INSERT INTO tests (name, suite) VALUES (?, ?)", (name, suite_of(name))).lastrowid
+
+    def record_run(self, test_run, environment=None, finished=None):
+        """
+            Adds a finished run in a single transaction
+            @param test_run (dict) - The results in the layout of the Test_Results_<run_id>.json
+            @param environment (string) - The environment the run was in
+            @param finished (float) - When the run finished, now by default
+            @return (int) - The id of the run in the store
+        """
+        finished = finished or time()
+        final = test_run.get('final_results') or {}
+        with self.conn:
+            run = self.conn.execute(
+                "INSERT INTO runs (run_id, host, browser, environment, started, finished, total, failed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (test_run.get('run_id'), test_run.get('name'), test_run.get('browser'), environment,
+                 test_run.get('start_time'), finished, len(final),
+                 len([x for x in final.values() if x['result'] not in ('passed', 'skipped')]))).lastrowid
+            for test_result in test_run.get('test_cases', []):
+                try:
+                    duration = float(test_result.get('duration'))
+                except (TypeError, ValueError):
+                    duration = None
+                attempt = self.conn.execute(
+                    "INSERT INTO attempts (run, test, attempt, result, duration) VALUES (?, ?, ?, ?, ?)",
+                    (run, self.test_id(test_result['name']), test_result.get('attempt', 1),
+                     test_result.get('result', 'failed'), duration)).lastrowid
+                self.conn.executemany(
+                    "INSERT INTO step_timings (attempt, position, step, duration) VALUES (?, ?, ?, ?)",
+                    [(attempt, position, step, step_duration)
+                     for position, (step, step_duration) in enumerate(test_result.get('steps') or [])])
+        return run
+
+    def durations(self, test, limit=5):
+        """
+            @param test (string) - Name of a test
+            @param limit (int) - How many of the most recent durations to return
+            @return (list) - Its most recent durations, newest first, skipped attempts left out
+        """
+        rows = self.conn.execute(
+            "SELECT a.duration FROM attempts a JOIN tests t ON t.id = a.test "
+            "WHERE t.name = ? AND a.result != 'skipped' AND a.duration IS NOT NULL "
+            "ORDER BY a.id DESC LIMIT ?", (test, limit))
+        return [row[0] for row in rows]
+
+    def recent_durations(self, limit=5):
+        """
+            @param limit (int) - How many of the most recent durations of each test to return
+            @return (dict) - Every test name to its most recent durations, newest first
+        """
+        rows = self.conn.execute(
+            "SELECT name, duration FROM ("
+            "  SELECT t.name, a.duration, ROW_NUMBER() OVER (PARTITION BY a.test ORDER BY a.id DESC) AS n"
+            "  FROM attempts a JOIN tests t ON t.id = a.test"
+            "  WHERE a.result != 'skipped' AND a.duration IS NOT NULL"
+            ") WHERE n <= ?", (limit,))
+        durations = {}
+        for name, duration in rows:
+            durations.setdefault(name, []).append(duration)
+        return durations
+
+    def failure_rate(self, since=0):
+        """
+            @param since (float) - Only count runs that finished after this time
+            @return (list) - The suite, number of attempts, failed attempts and failure rate, worst suite first
+        """
+        rows = self.conn.execute(
+            "SELECT t.suite, COUNT(*), SUM(a.result = 'failed') FROM runs r "
+            "JOIN attempts a ON a.run = r.id JOIN tests t ON t.id = a.test "
+            "WHERE r.finished >= ? AND a.result != 'skipped' GROUP BY t.suite", (since,))
+        rates = [(suite, total, failed, failed / float(total)) for suite, total, failed in rows]
+        return sorted(rates, key=lambda x: (-x[3], x[0] or ''))
+
+    def flaky(self, since=0):
+        """
+            @param since (float) - Only count runs that finished after this time
+            @return (list) - The name of each test that failed and then passed in the same run, and how many runs
+            that happened in, most often first
+        """
+        rows = self.conn.execute(
+            "SELECT t.name, COUNT(DISTINCT r.id) FROM runs r "
+            "JOIN attempts a ON a.run = r.id JOIN tests t ON t.id = a.test "
+            "WHERE r.finished >= ? AND a.attempt > 1 AND a.result = 'passed' "
+            "GROUP BY t.name ORDER BY 2 DESC, 1", (since,))
+        return rows.fetchall()
+
+    def runs(self, limit=10):
+        """
+            @param limit (int) - How many runs to return
+            @return (list) - The run_id, host, finished time, total and failed test_cases of the latest runs
+        """
+        return self.conn.execute("SELECT run_id, host, finished, total, failed FROM runs "
+                                 "ORDER BY finished DESC LIMIT ?", (limit,)).fetchall()
+
+
+def suite_of(name):
+    """
+        @param name (string) - Name of a test
+        @return string - The module the test is in, ti_login
+    """
+    from library.test_index import get_index
+    try:
+        entry = get_index().find(name)
+    except Exception:
+        entry = None
+    if entry:
+        return entry['module'].split('.')[-1]
+    match = SUITE.match(name)
+    return match.group(1) if match else None
+
+
+def record_current_run(test_run):
+    """
+        Adds the run that just finished to the history_db in the config, if there is one
+        @param test_run (dict) - The results in the layout of the Test_Results_<run_id>.json
+    """
+    config = Config()
+    path = config['history_db'] if 'history_db' in config else None
+    if not path:
+        return
+    try:
+        history = History(path)
+        try:
+            history.record_run(test_run, config['environment'])
+        finally:
+            history.close()
+    except sqlite3.Error as e:
+        logger.warning("Could not add the run to the history {}: {}".format(path, e))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Queries the run history store")
+    parser.add_argument('--db', required=True, help='The history_db to read')
+    parser.add_argument('--json', action='store_true', help='Print the answer as json')
+    commands = parser.add_subparsers(dest='command')
+    durations = commands.add_parser('durations', help='Last durations of a test')
+    durations.add_argument('test')
+    durations.add_argument('-n', default=5, type=int)
+    for name, text in (('failure_rate', 'Failure rate by suite'), ('flaky', 'Tests that failed then passed')):
+        command = commands.add_parser(name, help=text)
+        command.add_argument('--days', type=float, help='Only count runs from the last this many days')
+    runs = commands.add_parser('runs', help='The latest runs')
+    runs.add_argument('-n', default=10, type=int)
+    imports = commands.add_parser('import', help='Adds result files of earlier runs to the store')
+    imports.add_argument('files', nargs='+', help='Test_Results_<run_id>.json or .jsonl files')
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.error("a command is required")
+    if args.command != 'import' and not os.path.isfile(args.db):
+        parser.error("{} does not exist".format(args.db))
+
+    history = History(args.db)
+    since = time() - args.days * 86400 if getattr(args, 'days', None) else 0
+    if args.command == 'durations':
+        answer = history.durations(args.test if args.test.startswith('test_') else 'test_' + args.test, args.n)
+    elif args.command == 'failure_rate':
+        answer = history.failure_rate(since)
+    elif args.command == 'flaky':
+        answer = history.flaky(since)
+    elif args.command == 'runs':
+        answer = history.runs(args.n)
+    else:
+        answer = []
+        for file_name in args.files:
+            # A FILE THAT WAS NEVER ASSEMBLED FINISHED WHEN IT WAS LAST WRITTEN TO
+            history.record_run(load_results(file_name), finished=os.path.getmtime(file_name))
+            answer.append(file_name)
+    history.close()
+
+    if args.json:
+        print(json.dumps(answer))
+    else:
+        for row in answer:
+            if isinstance(row, (list, tuple)):
+                print('  '.join(str(x) for x in row))
+            else:
+                print(row)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
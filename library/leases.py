@@ -0,0 +1,192 @@
+"""
+Exclusive leases on the accounts of the test data, so test_cases running at the same time, in workers, forked children
+or other agents, never log in as the same user. A test asks the test data for an account of a pool:
+
+    td = ti.get_test_data()
+    user = td.lease('p1')
+
+and gets one of the accounts under p1 (user_one_p1, user_two_p1, ...) that no other running test holds. The leases are
+kept in a SQLite file (lease_file in the config, output_dir/leases.db by default), point every agent at the same file
+to share the accounts between them. A lease is released when its test ends. A lease whose process died on this host
+is freed the next time anyone asks for an account, and one held from another host is freed after lease_ttl seconds.
+"""
+import logging
+import os
+import socket
+import sqlite3
+from time import sleep, time
+
+from library.config import Config
+from library.test_queue import Connection
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    pool TEXT NOT NULL,
+    account TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    host TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (pool, account)
+);
+CREATE INDEX IF NOT EXISTS leases_owner ON leases (owner);
+"""
+
+# THE STORE OF THIS PROCESS, OPENED BY get_lease_store
+_store = None
+
+
+class LeaseUnavailable(Exception):
+    pass
+
+
+class LeaseStore(object):
+    """
+        The accounts currently leased, stored in a SQLite file that is shared by every process and agent of a run
+    """
+
+    def __init__(self, path, ttl=3600):
+        """
+            @param path (string) - Path to the SQLite file, created if it does not exist
+            @param ttl (int) - Seconds after which a lease held from another host is given up on
+        """
+        self.path = path
+        self.ttl = ttl
+        self.host = socket.gethostname()
+        conn = sqlite3.connect(path, timeout=60)
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def acquire(self, pool, accounts, owner):
+        """
+            Leases the first account of the pool that nobody holds
+            @param pool (string) - Name of the pool, p1
+            @param accounts (list) - Names of the accounts in the pool, in the order they are handed out
+            @param owner (string) - The test taking the account
+            @return string - The account leased, None if every account of the pool is taken
+        """
+        now = time()
+        with Connection(self.path) as conn:
+            self.expire(conn, pool, now)
+            taken = set(row[0] for row in conn.execute("SELECT account FROM leases WHERE pool = ?", (pool,)))
+            for account in accounts:
+                if account not in taken:
+                    conn.execute("INSERT INTO leases (pool, account, owner, host, pid, expires) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)", (pool, account, owner, self.host, os.getpid(),
+                                                               now + self.ttl))
+                    return account
+        return None
+
+    def expire(self, conn, pool, now):
+        """
+            Frees the leases of the pool held from another host that ran out, or whose process on this host is gone
+            @param conn (Connection) - Open connection inside of a write transaction
+            @param pool (string) - Name of the pool
+            @param now (float) - The current time
+        """
+        # A LIVE TEST ON THIS HOST KEEPS ITS ACCOUNT HOWEVER LONG IT RUNS, ITS LEASE GOES WITH ITS PROCESS BELOW
+        if os.name == 'nt':
+            conn.execute("DELETE FROM leases WHERE pool = ? AND expires < ?", (pool, now))
+        else:
+            conn.execute("DELETE FROM leases WHERE pool = ? AND expires < ? AND host != ?", (pool, now, self.host))
+        rows = conn.execute("SELECT account, owner, pid FROM leases WHERE pool = ? AND host = ?",
+                            (pool, self.host)).fetchall()
+        for account, owner, pid in rows:
+            if not pid_alive(pid):
+                logger.warning("Freeing {} of {}, held by {} which is no longer running".format(account, pool, owner))
+                conn.execute("DELETE FROM leases WHERE pool = ? AND account = ?", (pool, account))
+
+    def release(self, owner):
+        """
+            Frees every account the owner holds
+            @param owner (string) - The test that took the accounts
+            @return (int) - Number of accounts freed
+        """
+        with Connection(self.path) as conn:
+            return conn.execute("DELETE FROM leases WHERE owner = ?", (owner,)).rowcount
+
+    def held(self):
+        """
+            @return (list) - The pool, account and owner of every lease
+        """
+        with Connection(self.path) as conn:
+            return conn.execute("SELECT pool, account, owner FROM leases ORDER BY pool, account").fetchall()
+
+
+def pid_alive(pid):
+    """
+        @param pid (int) - A process id on this host
+        @return (bool) - False if the process is gone
+    """
+    if os.name == 'nt':
+        # os.kill ENDS THE PROCESS ON WINDOWS, THE LEASE RUNS OUT AFTER lease_ttl INSTEAD
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def lease_owner():
+    """
+        @return string - Name of the running test, unique across hosts and processes
+    """
+    config = Config()
+    return "{}:{}:{}".format(config['testname'] if 'testname' in config else 'none', socket.gethostname(), os.getpid())
+
+
+def get_lease_store():
+    """
+        Opens the store once per process from the lease_file in the config
+        @return LeaseStore
+    """
+    global _store
+    config = Config()
+    if _store is None or _store.path != config['lease_file']:
+        _store = LeaseStore(config['lease_file'], config['lease_ttl'])
+    return _store
+
+
+def lease_account(pool, accounts, wait=None):
+    """
+        Leases an account of the pool to the running test, waiting for one to be released if they are all taken
+        @param pool (string) - Name of the pool
+        @param accounts (list) - Names of the accounts in the pool
+        @param wait (int) - Seconds to wait for a free account, defaults to lease_wait in the config
+        @throws LeaseUnavailable - if no account of the pool was free in time
+        @return string - The account leased
+    """
+    config = Config()
+    wait = config['lease_wait'] if wait is None else wait
+    store = get_lease_store()
+    owner = lease_owner()
+    deadline = time() + wait
+    while True:
+        account = store.acquire(pool, accounts, owner)
+        if account is not None:
+            logger.info("Leased {} of {}".format(account, pool))
+            return account
+        if time() >= deadline:
+            raise LeaseUnavailable("All {} accounts of {} are leased".format(len(accounts), pool))
+        sleep(1)
+
+
+def release_leases():
+    """
+        Frees every account the running test holds, called when each test ends
+    """
+    if _store is None:
+        return
+    try:
+        freed = _store.release(lease_owner())
+        if freed:
+            logger.debug("Released {} leased accounts".format(freed))
+    except sqlite3.Error as e:
+        logger.warning("Could not release the leased accounts: {}".format(e))
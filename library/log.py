@@ -2,10 +2,20 @@
 Created on Dec 19, 2012
 
 @author: cody.coleman
+
+Every record goes through a single QueueHandler on the root logger, the test thread only puts the record on a queue.
+A background listener writes it to the console and to the log file of the test that was running when it was logged,
+keeping at most MAX_OPEN_FILES log files open at once. The log file is kept per thread, records of background threads
+(prefetching, bug lookups, browser health checks) only go to the console.
 '''
 
+import atexit
 import logging
 import os
+import queue
+import threading
+from collections import OrderedDict
+from logging.handlers import QueueHandler, QueueListener
 
 debug_formatter = logging.Formatter("%(asctime)s - [%(uuid)s: %(levelname)s] - [%(name)s:%(lineno)d] - %(message)s",
                                     "%m-%d %H:%M:%S")
@@ -23,6 +33,130 @@ class InjectUUID(logging.Filter):
         return True
 
 
+# HOW MANY TEST LOG FILES STAY OPEN, THE LEAST RECENTLY WRITTEN IS CLOSED TO MAKE ROOM
+MAX_OPEN_FILES = 16
+
+# THE LOG FILE OF THE TEST RUNNING ON EACH THREAD AND THE UNIQUE ID OF THE RUN, TAGGED ONTO EVERY RECORD AS IT IS LOGGED
+_test = threading.local()
+_uuid = ''
+
+# THE QUEUE HANDLER AND LISTENER OF THIS PROCESS, STARTED BY start_pipeline
+_handler = None
+_listener = None
+
+
+class TaggingQueueHandler(QueueHandler):
+    """
+        Tags each record with the log file and unique id of the test running when it was logged, then queues it
+    """
+
+    def prepare(self, record):
+        record.log_file = getattr(record, 'log_file', getattr(_test, 'log_file', None))
+        if not hasattr(record, 'uuid'):
+            record.uuid = _uuid
+        return QueueHandler.prepare(self, record)
+
+
+class TestFileRouter(logging.Handler):
+    """
+        Writes each record to the log file it was tagged with, keeping a bounded number of files open
+    """
+
+    def __init__(self, max_open=MAX_OPEN_FILES):
+        logging.Handler.__init__(self, logging.DEBUG)
+        self.max_open = max_open
+        self.files = OrderedDict()
+        self.setFormatter(debug_formatter)
+
+    def emit(self, record):
+        full_path = getattr(record, 'log_file', None)
+        if full_path is None:
+            return
+        try:
+            stream = self.files.pop(full_path, None)
+            if stream is None:
+                stream = open(full_path, 'a')
+                while len(self.files) >= self.max_open:
+                    self.files.popitem(last=False)[1].close()
+            self.files[full_path] = stream
+            stream.write(self.format(record) + '\n')
+            stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        while self.files:
+            self.files.popitem()[1].close()
+        logging.Handler.close(self)
+
+
+def start_pipeline(console=None, max_open=MAX_OPEN_FILES):
+    """
+    Replaces the handlers of the root logger with the queue handler, started once per process by log_init
+    Args:
+        console (Handler): Handler writing to the console, None for no console output
+        max_open (int): How many test log files to keep open
+    """
+    global _handler, _listener
+    stop_pipeline()
+    records = queue.Queue(-1)
+    _listener = QueueListener(records, TestFileRouter(max_open), *([console] if console else []),
+                              respect_handler_level=True)
+    _handler = TaggingQueueHandler(records)
+    logging.getLogger().addHandler(_handler)
+    _listener.start()
+
+
+def stop_pipeline():
+    """
+    Writes out every record still on the queue and closes the log files
+    """
+    global _handler, _listener
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _handler = _listener = None
+
+
+def flush_logs():
+    """
+    Waits until every record logged so far is written out
+    """
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+        _listener.start()
+
+
+def _before_fork():
+    # A FORKED CHILD GETS NO LISTENER THREAD, SO NOTHING CAN BE LEFT ON THE QUEUE OR IN A FILE BUFFER
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _after_fork_in_parent():
+    if _listener is not None and _listener._thread is None:
+        _listener.start()
+
+
+def _after_fork_in_child():
+    # THE CHILD GETS A QUEUE OF ITS OWN AND OPENS ITS OWN LOG FILES
+    if _listener is not None:
+        _handler.queue = _listener.queue = queue.Queue(-1)
+        for handler in _listener.handlers:
+            if isinstance(handler, TestFileRouter):
+                handler.close()
+        _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_before_fork, after_in_parent=_after_fork_in_parent,
+                        after_in_child=_after_fork_in_child)
+atexit.register(stop_pipeline)
+
+
 def log_init(level, path, uuid):
     """
     Initialize logging for starforge
@@ -31,6 +165,7 @@ def log_init(level, path, uuid):
         path (string): Where to write the file to
         uuid (string): Unique ID for the run
     """
+    global _uuid
     log_levels = {
         1: logging.INFO,
         0: logging.DEBUG,
@@ -49,31 +184,33 @@ def log_init(level, path, uuid):
     root_logger.setLevel(logging.DEBUG)
     s_handler = logging.StreamHandler()
     s_handler.setLevel(log_levels[level])
-    s_handler.addFilter(InjectUUID(uuid))
 
     if log_levels[level] == logging.DEBUG:
         s_handler.setFormatter(debug_formatter)
     else:
         s_handler.setFormatter(standard_formatter)
-    root_logger.addHandler(s_handler)
-    # log_to_file(path, root_logger, uuid)
+    _uuid = uuid
+    # THE CONSOLE IS WRITTEN BY THE LISTENER AS WELL, SO A TEST NEVER WAITS ON IT
+    start_pipeline(s_handler)
 
 
 def log_to_file(full_path, root_logger, uuid):
     """
-    Enabled debug logs to disk
+    Sends the debug logs of this thread from here on to a file on disk, the file of the previous test gets no more
+    records
     Args:
         full_path (string): The full path to the file
         root_logger (Logger): object to use the logger
         uuid (string): unique id used for formatting.
     """
-    root_logger = logging.getLogger()
+    global _uuid
     file_dir, file_name = os.path.split(full_path)
     if file_dir is not None:
         if not os.path.isdir(file_dir):
             os.makedirs(file_dir)
-    log_file_handler = logging.FileHandler(full_path)
-    log_file_handler.setLevel(logging.DEBUG)
-    log_file_handler.setFormatter(debug_formatter)
-    log_file_handler.addFilter(InjectUUID(uuid))
-    root_logger.addHandler(log_file_handler)
+    if _listener is None:
+        # NO CONSOLE WAS SET UP WITH log_init, ONLY THE FILES ARE WRITTEN
+        logging.getLogger().setLevel(logging.DEBUG)
+        start_pipeline()
+    _test.log_file = full_path
+    _uuid = uuid
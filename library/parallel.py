@@ -0,0 +1,104 @@
+"""
+Fans a list of test_cases out over a pool of worker processes. Each worker owns its own copy of the borg Config,
+its own Driver and its own log, screenshot and download directory. Every worker appends its results straight to the
+result stream of the run, see library.results.
+"""
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from time import time
+
+from library.config import Config
+from library.log import log_init
+
+logger = logging.getLogger(__name__)
+
+# TIME STAMP OF THE RUN, SET ONCE PER WORKER PROCESS BY init_worker
+_time_stamp = None
+
+
+def init_worker(shared_config, counter, level, time_stamp):
+    """
+        Initializes a worker process, giving it its own config state and output directory
+        @param shared_config (dict) - Copy of the parent's config values
+        @param counter (multiprocessing.Value) - Shared counter used to number the workers
+        @param level (int) - The log level to use for the console
+        @param time_stamp (string) - The time stamp of the run, used for the log file names
+    """
+    global _time_stamp
+    from library.helper import finish_run
+    with counter.get_lock():
+        counter.value += 1
+        index = counter.value
+    config = Config()
+    config.config = dict(shared_config)
+    worker_dir = os.path.join(shared_config['log_dir'], 'worker_{}'.format(index))
+    if not os.path.isdir(worker_dir):
+        os.makedirs(worker_dir)
+    # LOGS, SCREENSHOTS AND DOWNLOADS (Driver USES THE LOG DIR) ALL LAND IN THE WORKER DIR
+    config['worker'] = index
+    config['log_dir'] = worker_dir
+    config['report_dir'] = worker_dir
+    config['screen_shot_dir'] = worker_dir
+    log_init(level, worker_dir, config['run_id'])
+    _time_stamp = time_stamp
+    # WORKERS SKIP atexit, SO FLUSH BACKGROUND RESULTS AND QUIT POOLED BROWSERS WHEN THE WORKER SHUTS DOWN
+    multiprocessing.util.Finalize(None, finish_run, exitpriority=10)
+
+
+def run_worker_test(test):
+    """
+        Runs a single test inside of a worker process
+        @param test (string) - The name of the test to run
+        @return (tuple) - The name of the test, its status and how many seconds it took
+    """
+    from library.helper import run_test
+    start = time()
+    status = run_test(test, _time_stamp)
+    return test, status, time() - start
+
+
+def run_parallel(test_list, time_stamp, workers, level, results=None, on_result=None):
+    """
+        Runs the test_cases in the list across a pool of worker processes
+        @param test_list (list) - List of test_cases to run
+        @param time_stamp (string) - The time stamp of the run
+        @param workers (int) - How many worker processes to use
+        @param level (int) - The log level to use for the console of each worker
+        @param results (dict) - If passed, filled with the status of each test by name
+        @param on_result (function) - If passed, called with the name, status and duration of each finished test
+        @return (int) - The number of failed test_cases
+    """
+    from library.helper import log_progress
+    config = Config()
+    # SPAWN INSTEAD OF FORK SO EVERY WORKER STARTS WITH A CLEAN DRIVER AND LOGGING STATE
+    context = multiprocessing.get_context('spawn')
+    counter = context.Value('i', 0)
+    workers = min(workers, len(test_list))
+    fail_count = 0
+    fail_array = ""
+    count = 0
+    logger.info("Running {} test_cases across {} workers".format(len(test_list), workers))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker,
+                             initargs=(dict(config.items()), counter, level, time_stamp)) as executor:
+        futures = {executor.submit(run_worker_test, test): test for test in test_list}
+        for future in as_completed(futures):
+            count += 1
+            test = futures[future]
+            try:
+                _, status, duration = future.result()
+            except BrokenProcessPool:
+                logger.error("Worker running [{}] died before it could finish".format(test))
+                status, duration = 'Failed', 0.0
+            if results is not None:
+                results[test] = status
+            if on_result is not None:
+                on_result(test, status, duration)
+            if status not in ('Passed', 'Skipped'):
+                fail_count += 1
+                fail_array = test if fail_array == "" else "{} {}".format(fail_array, test)
+            log_progress(test, count, len(test_list), status, fail_count, fail_array)
+    return fail_count
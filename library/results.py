@@ -0,0 +1,185 @@
+"""
+Streaming result file of a run. Every test appends one JSON line to Test_Results_<run_id>.jsonl as it finishes instead
+of reading, extending and rewriting the whole Test_Results_<run_id>.json, so writing a result costs the same at the
+end of a long run as at the start. Appends are made with O_APPEND under an exclusive flock, so parallel workers and
+forked children write straight into the stream of the run with no merging afterwards.
+
+The first line holds the details of the run, then one line per test, then the final status of every test and the
+status of the bugs of the tests, which are looked up at the end of the run. The aggregate Test_Results_<run_id>.json,
+in the same layout as before, is assembled from the stream once at the end of the run, and load_results reads a run
+that never got that far (it crashed or was killed) from its stream instead.
+
+results_fsync in the config decides when the stream is flushed to disk: always (after every test, the default), end
+(once, when the run is assembled) or never.
+"""
+import json
+import logging
+import os
+
+from library.config import Config
+
+try:
+    import fcntl
+except ImportError:
+    # WINDOWS HAS NO flock, A SINGLE WRITE TO AN O_APPEND FILE IS ALL THERE IS
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ('always', 'end', 'never')
+
+
+def stream_file(json_file):
+    """
+        @param json_file (string) - Path to the Test_Results_<run_id>.json of a run
+        @return string - Path to the Test_Results_<run_id>.jsonl stream of the run
+    """
+    return os.path.splitext(json_file)[0] + '.jsonl'
+
+
+def fsync_policy():
+    """
+        @return string - always, end or never
+    """
+    config = Config()
+    policy = config['results_fsync'] if 'results_fsync' in config and config['results_fsync'] else 'always'
+    if policy not in FSYNC_POLICIES:
+        logger.warning("Unknown results_fsync [{}], using always".format(policy))
+        policy = 'always'
+    return policy
+
+
+def append_record(json_file, record, truncate=False):
+    """
+        Appends a single line to the stream of the run, safe with any number of processes writing at once
+        @param json_file (string) - Path to the Test_Results_<run_id>.json of the run
+        @param record (dict) - The line to write
+        @param truncate (bool) - Empties the stream first, for the first line of a run
+    """
+    line = (json.dumps(record, sort_keys=True) + '\n').encode('utf-8')
+    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | (os.O_TRUNC if truncate else 0)
+    fd = os.open(stream_file(json_file), flags, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        os.write(fd, line)
+        if fsync_policy() == 'always':
+            os.fsync(fd)
+    finally:
+        # CLOSING THE FILE RELEASES THE LOCK
+        os.close(fd)
+
+
+def start_run(json_file, run_info):
+    """
+        Starts the stream of a run with the details of the run
+        @param json_file (string) - Path to the Test_Results_<run_id>.json of the run
+        @param run_info (dict) - Host, os, browser and run_id of the run
+    """
+    append_record(json_file, dict(run_info, record='run'), truncate=True)
+
+
+def add_test(json_file, test_result):
+    """
+        @param json_file (string) - Path to the Test_Results_<run_id>.json of the run
+        @param test_result (dict) - The result of a single test, as built by Core.write_result
+    """
+    append_record(json_file, dict(test_result, record='test'))
+
+
+def add_final(json_file, final_results):
+    """
+        @param json_file (string) - Path to the Test_Results_<run_id>.json of the run
+        @param final_results (dict) - Test name to its final result and how many times it was run
+    """
+    append_record(json_file, {'record': 'final', 'final_results': final_results})
+
+
+def add_bug_status(json_file, statuses):
+    """
+        @param json_file (string) - Path to the Test_Results_<run_id>.json of the run
+        @param statuses (dict) - Bug id to its status, looked up once the run was over
+    """
+    append_record(json_file, {'record': 'bugs', 'bug_status': statuses})
+
+
+def read_records(path):
+    """
+        @param path (string) - Path to a Test_Results_<run_id>.jsonl stream
+        @return (list) - The records of the stream, a line cut short by a crash is left out
+    """
+    records = []
+    with open(path, 'r') as infile:
+        for number, line in enumerate(infile, 1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                logger.warning("Skipping unreadable line {} of {}".format(number, path))
+    return records
+
+
+def build_results(path):
+    """
+        Puts the records of a stream together in the layout of the Test_Results_<run_id>.json
+        @param path (string) - Path to a Test_Results_<run_id>.jsonl stream
+        @return (dict) - The details of the run, its test_cases and, if the run finished, its final_results
+    """
+    test_run = {'test_cases': []}
+    bug_status = {}
+    for record in read_records(path):
+        kind = record.pop('record', 'test')
+        if kind == 'run':
+            test_run.update(record)
+        elif kind == 'final':
+            test_run['final_results'] = record['final_results']
+        elif kind == 'bugs':
+            bug_status.update(record['bug_status'])
+        else:
+            test_run['test_cases'].append(record)
+    # BUGS LOOKED UP AT THE END OF THE RUN
+    for test_result in test_run['test_cases']:
+        bug = test_result.get('bug')
+        if bug and bug.get('bug_status') is None and bug['bug_text'] in bug_status:
+            bug['bug_status'] = bug_status[bug['bug_text']]
+    return test_run
+
+
+def assemble(json_file):
+    """
+        Writes the Test_Results_<run_id>.json of a run from its stream, replacing any earlier one in a single step
+        @param json_file (string) - Path to the Test_Results_<run_id>.json of the run
+        @return (dict) - The results that were written
+    """
+    path = stream_file(json_file)
+    policy = fsync_policy()
+    if policy == 'end':
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    test_run = build_results(path)
+    tmp_file = "{}.{}.tmp".format(json_file, os.getpid())
+    with open(tmp_file, 'w') as outfile:
+        outfile.write(json.dumps(test_run, sort_keys=True, indent=4))
+        if policy != 'never':
+            outfile.flush()
+            os.fsync(outfile.fileno())
+    os.replace(tmp_file, json_file)
+    return test_run
+
+
+def load_results(path):
+    """
+        Reads the results of a run, from its stream when the run was never assembled
+        @param path (string) - Path to a Test_Results_<run_id>.json or Test_Results_<run_id>.jsonl file
+        @return (dict) - The results in the layout of the Test_Results_<run_id>.json
+    """
+    if path.endswith('.jsonl'):
+        return build_results(path)
+    if not os.path.isfile(path) and os.path.isfile(stream_file(path)):
+        return build_results(stream_file(path))
+    with open(path, 'r') as infile:
+        return json.load(infile)
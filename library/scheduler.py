@@ -0,0 +1,193 @@
+"""
+Orders test_cases using the durations recorded in the Test_Results_*.json files (or the .jsonl streams of runs that
+never finished) of previous runs, so the longest tests
+start first and a slow test is never the last thing holding up a parallel or multi-agent run. Also estimates the wall
+clock time of a run for a given number of workers.
+"""
+import fnmatch
+import heapq
+import logging
+import os
+from collections import defaultdict, deque
+
+from library.results import load_results
+
+logger = logging.getLogger(__name__)
+
+# HOW MANY OF THE MOST RECENT DURATIONS OF A TEST ARE KEPT, THE MEDIAN OF THEM IS USED
+HISTORY = 5
+# DURATION ASSUMED FOR A TEST WHEN NO TEST HAS A RECORDED DURATION
+DEFAULT_DURATION = 60.0
+
+
+def test_key(test):
+    """
+        Normalizes a test name the way run_test does so names from the command line match names in the results
+        @param test (string) - ti_login_0001 or test_ti_login_0001
+        @return string - test_ti_login_0001
+    """
+    return test if test.startswith('test_') else 'test_{}'.format(test)
+
+
+def find_result_files(paths):
+    """
+        Finds all the result files of previous runs
+        @param paths (list) - Result files, or directories to search for result files
+        @return (list) - Paths of the result files, oldest first
+    """
+    found = []
+    for path in paths:
+        if os.path.isfile(path):
+            found.append(path)
+            continue
+        for root, _, file_names in os.walk(path):
+            for file_name in fnmatch.filter(file_names, 'Test_Results_*.json'):
+                found.append(os.path.join(root, file_name))
+            # A RUN THAT CRASHED BEFORE ITS RESULT FILE WAS ASSEMBLED ONLY HAS ITS STREAM
+            for file_name in fnmatch.filter(file_names, 'Test_Results_*.jsonl'):
+                if file_name[:-1] not in file_names:
+                    found.append(os.path.join(root, file_name))
+    return sorted(found, key=os.path.getmtime)
+
+
+def load_durations(paths, history_db=None):
+    """
+        Reads the recorded durations of every test out of the run history, or previous result files
+        @param paths (list) - Result files, or directories to search for result files
+        @param history_db (string) - The run history store, used instead of the paths when it exists
+        @return (dict) - Test name to the median of its most recent durations, in seconds
+    """
+    if history_db and os.path.isfile(history_db):
+        from library.history import History
+        store = History(history_db)
+        try:
+            durations = {test: median(values) for test, values in store.recent_durations(HISTORY).items()}
+        finally:
+            store.close()
+        logger.debug("Loaded durations of {} test_cases from {}".format(len(durations), history_db))
+        return durations
+    history = defaultdict(lambda: deque(maxlen=HISTORY))
+    for file_name in find_result_files(paths):
+        try:
+            results = load_results(file_name)
+        except (IOError, ValueError) as e:
+            logger.debug("Skipping unreadable result file {}: {}".format(file_name, e))
+            continue
+        for test_result in results.get('test_cases', []):
+            # SKIPPED TESTS NEVER RAN, THEIR 0 SECONDS SAY NOTHING ABOUT HOW LONG THEY TAKE
+            if test_result.get('result') == 'skipped':
+                continue
+            try:
+                history[test_key(test_result['name'])].append(float(test_result['duration']))
+            except (KeyError, TypeError, ValueError):
+                continue
+    durations = {test: median(values) for test, values in history.items()}
+    logger.debug("Loaded durations of {} test_cases".format(len(durations)))
+    return durations
+
+
+def median(values):
+    """
+        @param values (iterable) - Numbers
+        @return float
+    """
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return float(values[middle])
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def default_duration(durations):
+    """
+        @param durations (dict) - Known durations
+        @return float - The duration to assume for a test that has never been recorded
+    """
+    return median(durations.values()) if durations else DEFAULT_DURATION
+
+
+def expected_durations(test_list, durations):
+    """
+        @param test_list (list) - Test names
+        @param durations (dict) - Known durations
+        @return (dict) - Every test in the list to its expected duration
+    """
+    fallback = default_duration(durations)
+    return {test: durations.get(test_key(test), fallback) for test in test_list}
+
+
+def longest_first(test_list, durations):
+    """
+        Orders the test_cases so the longest running ones start first
+        @param test_list (list) - Test names
+        @param durations (dict) - Known durations
+        @return (list) - The test names, longest first, ties kept in their original order
+    """
+    expected = expected_durations(test_list, durations)
+    return sorted(test_list, key=lambda test: -expected[test])
+
+
+def estimate(test_list, durations, workers=1):
+    """
+        Estimates the wall clock time of the run by handing the longest test to the first free worker
+        @param test_list (list) - Test names
+        @param durations (dict) - Known durations
+        @param workers (int) - Number of workers or agents
+        @return (float) - Estimated seconds until the last test finishes
+    """
+    expected = expected_durations(test_list, durations)
+    finish_times = [0.0] * max(1, workers)
+    for test in longest_first(test_list, durations):
+        heapq.heapreplace(finish_times, finish_times[0] + expected[test])
+    return max(finish_times)
+
+
+def shard(test_list, index, count, durations):
+    """
+        Deterministically splits the test_cases into count slices of roughly equal run time and returns one of them.
+        Every node that sees the same test list and the same durations picks the same slices, so no coordination is
+        needed between them
+        @param test_list (list) - Test names
+        @param index (int) - Which slice to return, 1 through count
+        @param count (int) - How many slices to split the test_cases into
+        @param durations (dict) - Known durations, when empty every test counts the same
+        @return (list) - The test names in the slice, longest first
+    """
+    expected = expected_durations(test_list, durations)
+    # SORTED ON THE NAME AS WELL SO THE ORDER TESTS WERE PASSED IN DOESN'T CHANGE THE SLICES
+    ordered = sorted(set(test_list), key=lambda test: (-expected[test], test_key(test)))
+    # TIES ON RUN TIME (NO DURATIONS, OR TESTS RECORDED AS 0 SECONDS) FALL BACK TO THE NUMBER OF TESTS IN THE SLICE
+    loads = [(0.0, 0, i) for i in range(count)]
+    slices = [[] for _ in range(count)]
+    for test in ordered:
+        load, size, i = heapq.heappop(loads)
+        slices[i].append(test)
+        heapq.heappush(loads, (load + expected[test], size + 1, i))
+    logger.info("Shard {}/{} has {} of {} test_cases".format(index, count, len(slices[index - 1]), len(ordered)))
+    return slices[index - 1]
+
+
+def format_seconds(seconds):
+    """
+        @param seconds (float)
+        @return string - H:MM:SS
+    """
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{}:{:02}:{:02}".format(hours, minutes, seconds)
+
+
+def print_plan(test_list, durations, workers=1):
+    """
+        Prints how long the run is expected to take without running anything
+        @param test_list (list) - Test names
+        @param durations (dict) - Known durations
+        @param workers (int) - Number of workers or agents
+    """
+    known = len([test for test in test_list if test_key(test) in durations])
+    expected = expected_durations(test_list, durations)
+    print("Total test_cases: {} ({} with recorded durations, {} assumed to take {})".format(
+        len(test_list), known, len(test_list) - known, format_seconds(default_duration(durations))))
+    print("Total test time: {}".format(format_seconds(sum(expected.values()))))
+    print("Estimated wall clock with {} workers: {}".format(workers,
+                                                            format_seconds(estimate(test_list, durations, workers))))
@@ -0,0 +1,275 @@
+"""
+Daemon mode. slap.py --serve imports every test_case module, parses the test data and keeps warm browsers around once,
+then waits on a unix socket for runs. slap.py --connect sends its own arguments to the daemon instead of starting a
+run of its own, and prints the result of every test as the daemon streams it back, so a CI job starts running tests
+without paying for the imports, the config and the test data again.
+
+Every request is a single json line {"argv": [...]}, every reply line is json as well. The daemon runs one request at
+a time and gives each run its own run_id and its own directory under output_dir/current. --list, --plan, --shard and
+--queue are handled as slap.py handles them, --loop and --soak are refused.
+"""
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import uuid
+from contextlib import redirect_stdout
+
+from library.config import Config
+
+logger = logging.getLogger(__name__)
+
+# ARGUMENTS THAT HOLD A PATH, MADE ABSOLUTE BY THE CLIENT SINCE THE DAEMON RUNS FROM THE living_dir
+PATH_ARGS = ('-f', '--file', '--rerun_failed', '--rerun-failed', '--queue', '--durations')
+# FILES THE RUN WRITES, WHICH DON'T EXIST YET
+OUTPUT_ARGS = ('--junit',)
+
+
+class RunRefused(Exception):
+    pass
+
+
+class RunHandler(socketserver.StreamRequestHandler):
+    """
+        Runs the test_cases of one request and streams the results back over the connection
+    """
+
+    def send(self, message):
+        """
+            @param message (dict) - Written to the client as a single json line
+        """
+        try:
+            self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+            self.wfile.flush()
+        except (IOError, OSError) as e:
+            # THE CLIENT WENT AWAY, KEEP RUNNING SO THE RESULTS STILL LAND IN THE RESULT FILE
+            logger.debug("Client disconnected: {}".format(e))
+
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            argv = json.loads(line.decode('utf-8'))['argv']
+        except (ValueError, KeyError, TypeError):
+            self.send({'error': 'expected a json line with the argv of the run'})
+            return
+        try:
+            fail_count, json_file = self.server.run(argv, self.send)
+        except SystemExit:
+            # ARGPARSE PRINTS ITS OWN USAGE TO THE DAEMON LOG
+            self.send({'error': 'invalid arguments: {}'.format(' '.join(argv))})
+            return
+        except RunRefused as e:
+            self.send({'error': str(e)})
+            return
+        except Exception as e:
+            logger.exception("Run failed")
+            self.send({'error': str(e)})
+            return
+        self.send({'done': True, 'fail_count': fail_count, 'results_file': json_file})
+
+
+class SlapServer(socketserver.UnixStreamServer):
+    """
+        Unix socket server that runs one request at a time against the config loaded at start up
+    """
+
+    def __init__(self, path, level):
+        """
+            @param path (string) - Path of the unix socket, replaced if it is left over from a previous daemon
+            @param level (int) - The log level to use for the console of parallel workers
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        self.level = level
+        self.base_config = dict(Config().items())
+        socketserver.UnixStreamServer.__init__(self, path, RunHandler)
+
+    def run(self, argv, send):
+        """
+            Runs the test_cases the arguments ask for
+            @param argv (list) - Arguments as they would be passed to slap.py
+            @param send (function) - Called with a dict for each finished test
+            @throws RunRefused - if the arguments ask for something the daemon doesn't do
+            @return (tuple) - The number of failed test_cases and the path to the result file, None for --list and
+            --plan which only send back what they print
+        """
+        from library.helper import get_args, get_test_list, get_time_stamp, create_json_info, set_env, run_tests, \
+            rerun_failures, write_final_results, skip_tests
+        from library.parallel import run_parallel
+        from library.zygote import run_forked
+        from library.test_index import get_index
+        from library.test_data import clear_cache
+        from library.error_codes import check_error_codes
+        from library.scheduler import load_durations, longest_first, expected_durations, print_plan, shard
+        from library.test_queue import TestQueue, agent_name, run_queue
+        from framework.core import Core
+        from framework.junit import start_report, finish_report
+        args = get_args(argv)
+        if args.loop != 1 or args.soak:
+            raise RunRefused("--loop and --soak are not supported by the daemon, run them without --connect")
+        # PICK UP TEST MODULES AND TEST DATA THAT WERE EDITED SINCE THE LAST RUN
+        get_index(refresh=True)
+        clear_cache()
+        # EVERY RUN STARTS FROM THE CONFIG THE DAEMON WAS STARTED WITH
+        config = Config()
+        config.config = dict(self.base_config)
+        config['run_id'] = uuid.uuid4().hex[:4]
+        config['browser'] = args.browser
+        if args.device_type:
+            config['device'] = args.device_type
+        if args.reuse_browser is not None:
+            config['browser_reuse'] = args.reuse_browser
+        if args.pipeline:
+            config['pipeline'] = True
+        if args.lazy_browser:
+            config['lazy_browser'] = True
+        time_stamp = get_time_stamp()
+        set_env(args, config)
+        test_list = get_test_list(args)
+
+        # THE SAME SELECTION AND SCHEDULING AS slap.py
+        durations = {}
+        if args.shard or args.plan or (test_list and (args.workers > 1 or args.queue)):
+            durations = load_durations(args.durations or [config['output_dir']],
+                                       None if args.durations else config['history_db'])
+        if args.shard:
+            test_list = shard(test_list, args.shard[0], args.shard[1], durations)
+        if args.list:
+            test_list = sorted(test_list, key=lambda z: (z, z[-4:]))
+            send({'output': '\n' + '\n'.join(test_list) + '\nTotal test_cases found: \n{}'.format(len(test_list))})
+            return 0, None
+        if durations:
+            test_list = longest_first(test_list, durations)
+        if args.plan:
+            output = io.StringIO()
+            with redirect_stdout(output):
+                print_plan(test_list, durations, args.workers)
+            send({'output': output.getvalue().rstrip('\n')})
+            return 0, None
+
+        run_dir = os.path.join(self.base_config['log_dir'], config['run_id'])
+        os.makedirs(run_dir)
+        config['log_dir'] = run_dir
+        config['report_dir'] = run_dir
+        config['screen_shot_dir'] = run_dir
+        config['json_file_path'] = os.path.join(run_dir, "Test_Results_{}.json".format(config['run_id']))
+        logger.info("Run {} of {} test_cases requested".format(config['run_id'], len(test_list)))
+        check_error_codes(test_list)
+        create_json_info()
+        if args.junit:
+            config['junit_file'] = os.path.abspath(args.junit)
+            start_report(config['junit_file'], config['run_id'])
+        test_list, skipped = skip_tests(test_list)
+        config['attempt'] = 1
+        queue = None
+        if args.queue:
+            queue = TestQueue(args.queue, args.lease_timeout)
+            if test_list and not queue.enqueue(test_list, expected_durations(test_list, durations)) \
+                    and not queue.active():
+                raise RunRefused("Every test_case passed in is already done in the queue {}, remove it or pass a new "
+                                 "--queue to run them again".format(args.queue))
+
+        def on_result(test, status, duration):
+            send({'test': test, 'status': status, 'duration': round(duration, 3), 'attempt': config['attempt']})
+
+        results = {}
+        if queue is not None:
+            run_queue(queue, time_stamp, agent_name(args.agent), results, on_result)
+        elif args.fork:
+            run_forked(test_list, time_stamp, args.fork, args.workers, results, on_result)
+        elif args.workers > 1:
+            run_parallel(test_list, time_stamp, args.workers, self.level, results, on_result)
+        else:
+            run_tests(test_list, time_stamp, results, on_result)
+        attempts = rerun_failures(results, time_stamp, args.retries, args.workers, self.level, on_result, args.fork)
+        # THE BROWSERS STAY IN THE POOL FOR THE NEXT RUN, ONLY THE RESULTS ARE FLUSHED
+        Core.flush_results()
+        fail_count = len([status for status in results.values() if status not in ('Passed', 'Skipped')])
+        for test in skipped:
+            send({'test': test, 'status': 'Skipped', 'duration': 0.0, 'attempt': 1})
+        results.update(skipped)
+        write_final_results(results, attempts)
+        if args.junit:
+            finish_report(config['junit_file'])
+        return fail_count, config['json_file_path']
+
+
+def serve(path, level=1):
+    """
+        Starts the daemon and serves runs until it is killed
+        @param path (string) - Path of the unix socket to listen on
+        @param level (int) - The log level to use for the console of parallel workers
+    """
+    from framework.driver_pool import pool
+    from library.helper import preload_tests
+    preload_tests()
+    server = SlapServer(path, level)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt()
+
+    signal.signal(signal.SIGTERM, stop)
+    logger.info("Serving runs on {}".format(path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+        pool.drain()
+
+
+def connect(path, argv):
+    """
+        Sends a run to a daemon and prints its results as they come in
+        @param path (string) - Path of the unix socket the daemon listens on
+        @param argv (list) - The arguments of this slap.py, --connect is dropped and paths are made absolute
+        @return (int) - The number of failed test_cases, like a run of its own would exit with
+    """
+    request = []
+    skip = False
+    for i, arg in enumerate(argv):
+        if skip:
+            skip = False
+        elif arg == '--connect':
+            skip = True
+        elif arg.startswith('--connect='):
+            continue
+        elif i > 0 and (argv[i - 1] in OUTPUT_ARGS or argv[i - 1] in PATH_ARGS and os.path.exists(arg)):
+            request.append(os.path.abspath(arg))
+        else:
+            request.append(arg)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (IOError, OSError) as e:
+        print("Could not connect to the daemon on {}: {}".format(path, e))
+        return 1
+    sock.sendall((json.dumps({'argv': request}) + '\n').encode('utf-8'))
+    fail_count = 1
+    with sock.makefile('r') as replies:
+        for line in replies:
+            message = json.loads(line)
+            if 'error' in message:
+                print("Daemon error: {}".format(message['error']))
+                break
+            if 'output' in message:
+                print(message['output'])
+                continue
+            if message.get('done'):
+                fail_count = message['fail_count']
+                if message['results_file'] is not None:
+                    print("Results: {}".format(message['results_file']))
+                    print("Total Failures: [{}]".format(fail_count))
+                break
+            print("{} [{}] {}s{}".format(message['status'], message['test'], message['duration'],
+                                         '' if message['attempt'] == 1 else " (attempt {})".format(message['attempt'])))
+            sys.stdout.flush()
+    sock.close()
+    return fail_count
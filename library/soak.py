@@ -0,0 +1,155 @@
+"""
+Soak mode statistics. Running the same list of test_cases over and over for hours, the duration of every test run is
+folded into a log bucketed histogram instead of being kept, so memory stays flat no matter how long the soak runs,
+while still giving p50/p90/p99 durations, throughput and the failures of every iteration.
+"""
+import argparse
+import logging
+import math
+import re
+from array import array
+from time import time
+
+logger = logging.getLogger(__name__)
+
+
+class DurationHistogram(object):
+    """
+        Histogram of durations in buckets that grow by GROWTH each, so percentiles are accurate to within ~2.5%
+    """
+    # SMALLEST DURATION THAT GETS ITS OWN BUCKET, IN SECONDS
+    BASE = 0.01
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        """
+            @param seconds (float) - A duration to add to the histogram
+        """
+        bucket = 0 if seconds <= self.BASE else int(math.log(seconds / self.BASE, self.GROWTH)) + 1
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, percent):
+        """
+            @param percent (float) - 0 through 100
+            @return (float) - The duration the given percent of the recorded durations fall under, None if empty
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, int(math.ceil(self.count * percent / 100.0)))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                # MIDDLE OF THE BUCKET, KEPT INSIDE WHAT WAS ACTUALLY SEEN
+                upper = self.BASE * self.GROWTH ** bucket
+                value = upper if bucket == 0 else upper / math.sqrt(self.GROWTH)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+
+class SoakStats(object):
+    """
+        Collects the timings and failures of a soak run
+    """
+
+    def __init__(self):
+        self.start = time()
+        self.overall = DurationHistogram()
+        self.tests = {}
+        self.failures = {}
+        # ONE UNSIGNED INT PER ITERATION
+        self.iteration_failures = array('I')
+
+    def record(self, test, status, duration):
+        """
+            Records a finished test, matches the on_result callback of the runners
+            @param test (string) - Name of the test
+            @param status (string) - Passed, Failed, Skipped or Not Found, failures are counted by end_iteration
+            @param duration (float) - Seconds the test took, browser start included
+        """
+        self.overall.record(duration)
+        self.tests.setdefault(test, DurationHistogram()).record(duration)
+
+    def end_iteration(self, results):
+        """
+            Closes out an iteration, logging how it went. A test that failed and then passed on a retry is not a failure
+            @param results (dict) - The final status of each test of the iteration by name
+            @return (int) - The number of test_cases that failed in the iteration
+        """
+        fail_count = 0
+        for test, status in results.items():
+            if status not in ('Passed', 'Skipped'):
+                self.failures[test] = self.failures.get(test, 0) + 1
+                fail_count += 1
+        self.iteration_failures.append(fail_count)
+        logger.info("SOAK ITERATION {}: {} failures, {} tests run, {:.1f} tests/min, p90 {}".format(
+            len(self.iteration_failures), fail_count, self.overall.count, self.throughput(),
+            format_duration(self.overall.percentile(90))))
+        return fail_count
+
+    def throughput(self):
+        """
+            @return (float) - Tests finished per minute since the soak started
+        """
+        elapsed = time() - self.start
+        return self.overall.count * 60.0 / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        """
+            @return (string) - Table of the per test and overall durations, throughput and failures
+        """
+        row = "{:<40} {:>6} {:>6} {:>9} {:>9} {:>9} {:>9}"
+        lines = ["", row.format("TEST", "RUNS", "FAILS", "P50", "P90", "P99", "MAX")]
+        for test in sorted(self.tests):
+            lines.append(self.format_row(row, test, self.tests[test], self.failures.get(test, 0)))
+        lines.append(self.format_row(row, "ALL", self.overall, sum(self.failures.values())))
+        lines.append("")
+        lines.append("Soaked for {} over {} iterations, {:.1f} tests/min".format(
+            format_duration(time() - self.start), len(self.iteration_failures), self.throughput()))
+        lines.append("Failures per iteration: {}".format(" ".join(str(x) for x in self.iteration_failures)))
+        return "\n".join(lines)
+
+    @staticmethod
+    def format_row(row, name, histogram, fails):
+        return row.format(name, histogram.count, fails,
+                          format_duration(histogram.percentile(50)),
+                          format_duration(histogram.percentile(90)),
+                          format_duration(histogram.percentile(99)),
+                          format_duration(histogram.max))
+
+
+def format_duration(seconds):
+    """
+        @param seconds (float)
+        @return string - Seconds with one decimal, or hours and minutes for long durations
+    """
+    if seconds is None:
+        return '-'
+    if seconds < 600:
+        return "{:.1f}s".format(seconds)
+    minutes, _ = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{}h{:02}m".format(hours, minutes)
+
+
+def soak_duration(value):
+    """
+        Parses the --soak argument
+        @param value (string) - A number of seconds, or a number followed by s, m, h or d such as 90m or 24h
+        @return (float) - Seconds
+    """
+    match = re.match(r'^(\d+(?:\.\d+)?)([smhd]?)$', value.strip().lower())
+    if not match:
+        raise argparse.ArgumentTypeError("expected a duration such as 3600, 90m or 24h, got '{}'".format(value))
+    return float(match.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}[match.group(2)]
@@ -0,0 +1,66 @@
+"""
+Start up profiling. slap.py --profile_startup runs the same command again under python -X importtime and prints the
+modules that took the longest to import once it exits, so a heavy import that sneaks onto the start up path shows up
+before it slows down every CI job.
+"""
+import subprocess
+import sys
+
+# FLAGS DROPPED FROM THE COMMAND THAT IS PROFILED
+PROFILE_FLAGS = ('--profile_startup', '--profile-startup')
+
+
+def parse_importtime(lines):
+    """
+        @param lines (list) - The "import time:" lines python -X importtime writes to stderr
+        @return (list) - (cumulative microseconds, self microseconds, module, nesting depth) of every import
+    """
+    imports = []
+    for line in lines:
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        try:
+            # ONE SPACE BEFORE A TOP LEVEL IMPORT, TWO MORE FOR EVERY LEVEL OF NESTING
+            depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+            imports.append((int(parts[1]), int(parts[0]), parts[2].strip(), depth))
+        except ValueError:
+            # THE HEADER LINE
+            continue
+    return imports
+
+
+def format_report(imports, top=25):
+    """
+        @param imports (list) - The output of parse_importtime
+        @param top (int) - How many of the slowest imports to show
+        @return string - The total import time and the slowest imports by cumulative time
+    """
+    # THE CUMULATIVE TIMES OF THE TOP LEVEL IMPORTS ADD UP TO THE TOTAL
+    total = sum(cumulative for cumulative, _, _, depth in imports if depth == 0)
+    lines = ["", "Imported {} modules in {:.3f}s".format(len(imports), total / 1e6),
+             "{:>10} {:>10}  {}".format("CUMULATIVE", "SELF", "MODULE")]
+    for cumulative, own, module, _ in sorted(imports, reverse=True)[:top]:
+        lines.append("{:>9.1f}ms {:>8.1f}ms  {}".format(cumulative / 1e3, own / 1e3, module))
+    return "\n".join(lines)
+
+
+def profile_startup(script, argv, top=25):
+    """
+        Runs slap.py again with python -X importtime, passing everything but the import timings through
+        @param script (string) - Path of slap.py
+        @param argv (list) - The arguments of this run
+        @param top (int) - How many of the slowest imports to show
+        @return (int) - The exit code of the profiled run
+    """
+    command = [sys.executable, '-X', 'importtime', script] + [arg for arg in argv if arg not in PROFILE_FLAGS]
+    process = subprocess.Popen(command, stderr=subprocess.PIPE, universal_newlines=True)
+    timings = []
+    for line in process.stderr:
+        if line.startswith('import time:'):
+            timings.append(line)
+        else:
+            sys.stderr.write(line)
+    code = process.wait()
+    print(format_report(parse_importtime(timings), top))
+    return code
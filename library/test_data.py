@@ -1,4 +1,7 @@
 import yaml
+import base64
+import datetime
+import json
 import logging
 import fnmatch
 import os
@@ -7,6 +10,22 @@ from box import Box, BoxKeyError
 
 logger = logging.getLogger(__name__)
 
+# BUMPED WHEN THE LAYOUT OF THE CACHE FILE CHANGES SO OLD FILES ARE IGNORED
+CACHE_VERSION = 2
+
+# scan_environment COULDN'T TELL THE ENVIRONMENT OF A FILE WITHOUT PARSING IT
+UNKNOWN = object()
+
+# KEYS MARKING THE VALUES OF THE JSON CACHE THAT JSON HAS NO TYPE FOR
+JSON_TAGS = ('__items__', '__datetime__', '__date__', '__bytes__', '__set__')
+
+# PARSED test_data SECTION OF EVERY YAML FILE SEEN BY THIS PROCESS, KEYED ON THE PATH
+_files = {}
+# THE TestData HANDED OUT FOR EACH DIRECTORY, EXCLUSION AND ENVIRONMENT, SHARED BY EVERY TEST OF THE PROCESS
+_memo = {}
+# CACHE FILES ALREADY READ BY THIS PROCESS
+_loaded = set()
+
 
 class TestData(Box):
     def __getattr__(self, item):
@@ -15,26 +34,214 @@ class TestData(Box):
         except BoxKeyError:
             return None
 
+    def lease(self, pool, wait=None):
+        """
+        leases one of the accounts of a pool to the running test, no other test running at the same time gets it until
+        this test ends
+        @param string pool: the section holding the accounts, p1 or a dotted path such as p1.admins
+        @param int wait: seconds to wait for an account to be released if they are all taken, defaults to lease_wait
+        @note the accounts of a pool are the entries of the section that are sections themselves, user_one_p1
+        @return: Test Data of the account with its name under account
+        """
+        from library.leases import lease_account
+        section = self
+        for key in pool.split('.'):
+            section = section[key]
+        accounts = [name for name, value in section.items() if isinstance(value, dict)]
+        name = lease_account(pool, accounts, wait)
+        return TestData(dict({'account': name}, **section[name]), frozen_box=True)
+
 
-def map_yaml(directory, exclusion, environment):
+def map_yaml(directory, exclusion, environment, cache_file=None):
     """
     parses through all the yaml files in the assets directory creating a multi-level dictionary object
     @param string directory: where to start looking for all the test data
     @param list exclusion: a list of files to exclude from the test data load
     @param environment: The datacenters this test run is in, and the test data to pull
+    @param string cache_file: If set, the parsed files are kept in this file between runs and only files whose mtime
+    or size changed are parsed again
     @note This only allows a single level mapping, no deeper. In almost all cases when trying to go deeper, you should
     just re-work the test data
+    @note Each file is parsed at most once per process, and every call with the same arguments gets the same read only
+    TestData. Call clear_cache to pick up files edited since
     @return: Test Data dictionary object
     """
+    key = (directory, tuple(exclusion), environment)
+    if key in _memo:
+        return _memo[key]
+    if cache_file and cache_file not in _loaded:
+        load_cache(cache_file)
+    changed = False
     test_data = {}
 
     for root, dirnames, filenames in os.walk(directory):
         for filename in fnmatch.filter(filenames, '*.yaml'):
             if filename not in exclusion:
-                tmp_config = yaml.load(open(os.path.join(root, filename), 'rb').read())
-                if 'environment' in tmp_config['test_data'] and tmp_config['test_data'][
-                    'environment'] == environment:
-                    test_data.update(tmp_config['test_data'])
+                path = os.path.join(root, filename)
+                entry, parsed = data_file(path, environment)
+                changed = changed or parsed
+                # FILES OF OTHER ENVIRONMENTS ARE SKIPPED ON THEIR ENVIRONMENT WITHOUT BEING PARSED
+                if entry['environment'] == environment:
+                    test_data.update(entry['data'])
 
+    if changed and cache_file:
+        save_cache(cache_file)
     logger.info("Loaded {} configs".format(len(test_data)))
-    return TestData(test_data)
+    _memo[key] = TestData(test_data, frozen_box=True)
+    return _memo[key]
+
+
+def data_file(path, environment=None):
+    """
+    Gets the test_data section of a yaml file, parsing it only if it is new or changed since it was last parsed. A new
+    or changed file of another environment is only read up to its environment, its data is parsed the first time a
+    run of its environment needs it
+    @param string path: The yaml file
+    @param environment: The environment of the run
+    @return: tuple of the entry of the file (environment, data, mtime and size) and whether it was read
+    """
+    stat = os.stat(path)
+    entry = _files.get(path)
+    if entry is not None and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+        if entry['data'] is not None or entry['environment'] != environment:
+            return entry, False
+    else:
+        with open(path, 'rb') as f:
+            found = scan_environment(f)
+        if found is not UNKNOWN and found != environment:
+            entry = dict(environment=found, data=None, mtime=stat.st_mtime, size=stat.st_size)
+            _files[path] = entry
+            return entry, True
+    with open(path, 'rb') as f:
+        tmp_config = yaml.safe_load(f) or {}
+    data = tmp_config.get('test_data') or {}
+    entry = dict(environment=data.get('environment'), data=data, mtime=stat.st_mtime, size=stat.st_size)
+    _files[path] = entry
+    return entry, True
+
+
+def scan_environment(stream):
+    """
+    Reads a yaml file only as far as the environment of its test_data section, without building any of the data
+    @param stream: The open yaml file
+    @return: The environment, None if the test_data section has none, UNKNOWN if the file has to be parsed to tell
+    """
+    resolver = yaml.resolver.Resolver()
+    # ONE ENTRY PER OPEN MAPPING OR SEQUENCE: WHETHER IT IS A MAPPING, WHETHER A KEY IS NEXT AND THE LAST KEY
+    stack = []
+    try:
+        for event in yaml.parse(stream, Loader=yaml.SafeLoader):
+            if isinstance(event, yaml.AliasEvent) or getattr(event, 'anchor', None):
+                # ANCHORS AND MERGE KEYS ARE LEFT TO THE PARSER
+                return UNKNOWN
+            if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent, yaml.ScalarEvent)) and stack:
+                parent = stack[-1]
+                if parent[0] and parent[1]:
+                    # A KEY OF THE MAPPING
+                    if not isinstance(event, yaml.ScalarEvent) or event.value == '<<':
+                        return UNKNOWN
+                    parent[1], parent[2] = False, event.value
+                    continue
+                key = parent[2] if parent[0] else None
+                parent[1] = parent[0]
+                in_test_data = len(stack) == 2 and stack[0][2] == 'test_data'
+                if in_test_data and key == 'environment':
+                    if not isinstance(event, yaml.ScalarEvent) or event.tag not in (None, '!'):
+                        return UNKNOWN
+                    tag = resolver.resolve(yaml.ScalarNode, event.value, event.implicit)
+                    if tag == 'tag:yaml.org,2002:null':
+                        return None
+                    return event.value if tag == 'tag:yaml.org,2002:str' else UNKNOWN
+            if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+                stack.append([isinstance(event, yaml.MappingStartEvent), True, None])
+            elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+                stack.pop()
+                if len(stack) == 1 and stack[0][2] == 'test_data':
+                    # THE END OF THE test_data SECTION, IT HAS NO ENVIRONMENT
+                    return None
+    except yaml.YAMLError:
+        return UNKNOWN
+    return None
+
+
+def load_cache(cache_file):
+    """
+    Reads the files parsed by previous runs
+    @param string cache_file: The cache written by save_cache
+    """
+    _loaded.add(cache_file)
+    try:
+        with open(cache_file, 'r') as f:
+            cache = json.load(f, object_hook=from_json)
+        if cache.get('version') == CACHE_VERSION:
+            for path, entry in cache['files'].items():
+                _files.setdefault(path, entry)
+    except Exception as e:
+        logger.debug("Not using the test data cache {}: {}".format(cache_file, e))
+
+
+def save_cache(cache_file):
+    """
+    Writes every parsed file out for the next run, replacing the old cache in one step
+    @param string cache_file: Where to write the cache
+    """
+    tmp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump(to_json(dict(version=CACHE_VERSION, files=_files)), f)
+        os.replace(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        logger.warning("Could not save the test data cache to {}: {}".format(cache_file, e))
+
+
+def to_json(value):
+    """
+    Converts what yaml.safe_load returns to values json can hold, tagging the ones json has no type for so from_json
+    gives them back as they were
+    @param value: A value out of a parsed yaml file
+    @return: The value with dates, binary, sets and dicts with keys that aren't strings tagged
+    """
+    if isinstance(value, dict):
+        # A DICT THAT WOULD READ BACK AS A TAG IS KEPT AS ITEMS AS WELL
+        if all(isinstance(key, str) for key in value) and not (len(value) == 1 and list(value)[0] in JSON_TAGS):
+            return {key: to_json(item) for key, item in value.items()}
+        return {'__items__': [[to_json(key), to_json(item)] for key, item in value.items()]}
+    if isinstance(value, list):
+        return [to_json(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, (set, frozenset)):
+        return {'__set__': [to_json(item) for item in value]}
+    return value
+
+
+def from_json(obj):
+    """
+    object_hook for json.load, gives back the values to_json tagged
+    @param dict obj: A json object
+    @return: The value it was tagged from, or the object as it is
+    """
+    if len(obj) != 1 or list(obj)[0] not in JSON_TAGS:
+        return obj
+    tag, value = next(iter(obj.items()))
+    if tag == '__items__':
+        return {key: item for key, item in value}
+    if tag == '__datetime__':
+        return datetime.datetime.fromisoformat(value)
+    if tag == '__date__':
+        return datetime.date.fromisoformat(value)
+    if tag == '__bytes__':
+        return base64.b64decode(value)
+    return set(value)
+
+
+def clear_cache():
+    """
+    Forgets the TestData handed out so far, for processes that outlive a run. Files are checked for changes again on
+    the next map_yaml, unchanged ones are not parsed again
+    """
+    _memo.clear()
@@ -0,0 +1,359 @@
+"""
+Persistent index of every test_case listed in the test_case_file. Maps each test name to the module and class it
+lives in along with the metadata parsed out of its docstring, so finding a test to run, listing tests and exporting
+their metadata are dictionary lookups instead of importing and walking every suite.
+
+Test modules are never imported to build the index, their source is parsed with ast, so nothing in them (verbs,
+config, test data loaded at import time) is executed. The index is stored as json in the test_index_file (the
+output_dir by default). Each module's entry remembers the mtime and size of its file and is only rebuilt when the file
+changes.
+"""
+import ast
+import json
+import logging
+import os
+import re
+
+import yaml
+
+from library.config import Config
+
+logger = logging.getLogger(__name__)
+
+# BUMPED WHEN THE LAYOUT OF THE INDEX CHANGES SO OLD FILES ARE REBUILT
+VERSION = 3
+
+# STRINGS IN A TEST THAT ARE ERROR CODES
+ERROR_CODE = re.compile(r'^[A-Z]+_\d{4}$')
+
+# THE INDEX OF THIS PROCESS, LOADED BY get_index
+_index = None
+
+
+def parse_test_doc(name, doc_string):
+    """
+        Parses the doxygen style docstring of a test into its metadata
+        @param name (string) - The name of the test
+        @param doc_string (string) - The docstring of the test
+        @return (dict) - name, title, bug and tags, plus test, priority, author, date, version, deprecated,
+                datacenters, no_environment and note when the docstring has them
+    """
+    doc_string = doc_string or ''
+    doc_list = [x.strip().replace('\t', '') for x in doc_string.split('\n') if len(x.strip().replace('\t', '')) > 0]
+    # CREATE DOC DICT OBJECT
+    doc_dict = dict(name=name, title=doc_list[0] if doc_list else '', bug='', tags=[])
+    for val in doc_list[1:]:
+        if '@test' in val:
+            doc_dict['test'] = val[5:]
+        elif '@arg' in val:
+            doc_dict['tags'] = [x.lower() for x in val[4:].split()]
+        elif '@attention' in val:
+            doc_dict['priority'] = val[10:]
+        elif '@author' in val:
+            doc_dict['author'] = val[7:]
+        elif '@date' in val:
+            doc_dict['date'] = val[5:]
+        elif '@bug' in val:
+            doc_dict['bug'] = val[4:].strip()
+        elif '@version' in val:
+            doc_dict['version'] = int(val[8:].replace(".", ""))
+        elif '@deprecated' in val:
+            doc_dict['deprecated'] = True
+        elif '@note' in val:
+            env_result = re.findall(r'ENV=(\w+)', val.upper())
+            if len(env_result) > 0:
+                doc_dict['datacenters'] = env_result
+            env_not = re.findall(r'ENV!=(\w+)', val.upper())
+            if len(env_not) > 0:
+                doc_dict['no_environment'] = env_not
+            priority = re.findall(r'priority=(\d)', val.lower())
+            if len(priority) > 0:
+                doc_dict['priority'] = priority[0]
+            else:
+                doc_dict['note'] = val[5:]
+    # CHECK IF TITLE AND NOTE NOT IN DOC_DICT
+    if 'title' not in doc_dict:
+        doc_dict['Title'] = 'TEST DOCUMENTATION DOES NOT INCLUDE THE TEST TITLE'
+    if 'test' not in doc_dict:
+        doc_dict['Test'] = 'TEST DOCUMENTATION DOES NOT INCLUDE TEST DESCRIPTION'
+    return doc_dict
+
+
+def test_steps(source):
+    """
+        @param source (string) - Source code of a test
+        @return (list) - The # comments of the test, which describe its steps
+    """
+    return [x.capitalize().replace('"', '') for x in re.findall(r"# (.+)\n", source)]
+
+
+def error_codes(node):
+    """
+        @param node (ast.FunctionDef) - A test
+        @return (list) - The error codes (GOTO_0000) the test fails its assertions with
+    """
+    codes = set()
+    for item in ast.walk(node):
+        if isinstance(item, ast.Constant) and isinstance(item.value, str) and ERROR_CODE.match(item.value):
+            codes.add(item.value)
+    return sorted(codes)
+
+
+def class_tags(node):
+    """
+        Finds the tags a suite adds to all of its test_cases in its __init__, self.doc_dict['tags'] += ['login']
+        @param node (ast.ClassDef) - The class of the suite
+        @return (list) - The tags, lower case
+    """
+    tags = []
+    for item in node.body:
+        if not (isinstance(item, ast.FunctionDef) and item.name == '__init__'):
+            continue
+        for stmt in ast.walk(item):
+            if not (isinstance(stmt, ast.AugAssign) and isinstance(stmt.target, ast.Subscript)):
+                continue
+            target = stmt.target
+            # PYTHON 3.8 WRAPS THE KEY IN AN ast.Index
+            key = target.slice if isinstance(target.slice, ast.Constant) else getattr(target.slice, 'value', None)
+            if isinstance(target.value, ast.Attribute) and target.value.attr == 'doc_dict' and \
+                    isinstance(key, ast.Constant) and key.value == 'tags':
+                try:
+                    tags += [str(x).lower() for x in ast.literal_eval(stmt.value)]
+                except ValueError:
+                    logger.debug("Tags of {} are not a literal list".format(node.name))
+    return tags
+
+
+def test_priority(doc):
+    """
+        @param doc (dict) - Metadata of a test
+        @return (int) - The priority of the test, 3 when it has none or it isn't a number
+    """
+    try:
+        return int(str(doc.get('priority', 3)).strip())
+    except ValueError:
+        return 3
+
+
+def runs_in(doc, environment):
+    """
+        Checks the @note ENV= and ENV!= restrictions of a test the same way TestTemplate.ok_to_run does
+        @param doc (dict) - Metadata of a test
+        @param environment (string) - The environment of the run
+        @return (bool) - False if the test would be skipped in this environment
+    """
+    environment = environment.upper()
+    if 'datacenters' in doc and len([s for s in doc['datacenters'] if s in environment]) == 0:
+        return False
+    if 'no_environment' in doc and environment in doc['no_environment']:
+        return False
+    return True
+
+
+def skip_reason(doc, environment, version=None):
+    """
+        Decides whether a test would skip itself in TestTemplate.ok_to_run, without building or running it
+        @param doc (dict) - Metadata of a test
+        @param environment (string) - The environment of the run
+        @param version (int) - The driver_version in the config, None if it isn't set
+        @return string - Why the test is skipped, None if it runs
+    """
+    if 'deprecated' in doc:
+        return "This test has been deprecated"
+    if 'version' in doc and version is not None and int(version) < doc['version']:
+        return "Features unavailable in this version: {}".format(doc['version'])
+    if 'datacenters' in doc and not runs_in(doc, environment):
+        return "Test only works in {}".format(doc['datacenters'])
+    if 'no_environment' in doc and not runs_in(doc, environment):
+        return "Test does not work in {}".format(doc['no_environment'])
+    return None
+
+
+class TestIndex(object):
+    """
+        Test name to module, class and docstring metadata, for every test_case in the test_case_file
+    """
+
+    def __init__(self, path=None, test_case_file=None):
+        """
+            @param path (string) - The json file the index is kept in, defaults to the test_index_file in the config
+            @param test_case_file (string) - The yaml listing the test_case modules, defaults to the one in the config
+        """
+        config = Config()
+        self.path = path or config['test_index_file']
+        self.test_case_file = test_case_file or config['test_case_file']
+        self.modules = {}
+        self.tests = {}
+        self.changed = False
+
+    def load(self):
+        """
+            Reads the index from disk, then rebuilds the entries of the modules that changed since it was written
+            @return TestIndex - self
+        """
+        try:
+            with open(self.path, 'r') as infile:
+                stored = json.load(infile)
+            if stored.get('version') == VERSION:
+                self.modules = stored['modules']
+        except (IOError, ValueError, KeyError) as e:
+            logger.debug("Building a new test index, could not read {}: {}".format(self.path, e))
+        self.refresh()
+        return self
+
+    def refresh(self):
+        """
+            Rebuilds the entries of modules that were added or changed and drops the ones no longer listed
+        """
+        with open(self.test_case_file, 'r') as f:
+            tc_config = yaml.safe_load(f) or {}
+        listed = {}
+        for k, v in tc_config.items():
+            for package in v or []:
+                listed['test_cases.{}.{}'.format(k, package)] = os.path.join('test_cases', k, '{}.py'.format(package))
+        for module_name in list(self.modules):
+            if module_name not in listed:
+                del self.modules[module_name]
+                self.changed = True
+        for module_name, path in listed.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                logger.error("Test module {} listed in {} was not found".format(path, self.test_case_file))
+                self.modules.pop(module_name, None)
+                continue
+            entry = self.modules.get(module_name)
+            if entry is None or entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size:
+                logger.debug("Indexing {}".format(module_name))
+                self.modules[module_name] = dict(path=path, mtime=stat.st_mtime, size=stat.st_size,
+                                                 tests=self.scan(path))
+                self.changed = True
+        self.tests = {}
+        for module_name, entry in self.modules.items():
+            for test, info in entry['tests'].items():
+                self.tests[test] = dict(info, module=module_name)
+        if self.changed:
+            self.save()
+
+    @staticmethod
+    def scan(path):
+        """
+            Finds the test_cases of a module by parsing its source, without importing it
+            @param path (string) - Path to the module
+            @return (dict) - Test name to its class, line, metadata, steps and error codes
+        """
+        tests = {}
+        try:
+            with open(path, 'r') as infile:
+                source = infile.read()
+            tree = ast.parse(source, path)
+        except (IOError, SyntaxError, ValueError) as e:
+            logger.error("Failed to parse {}: {}".format(path, e))
+            return tests
+        lines = source.splitlines()
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef):
+                continue
+            suite_tags = class_tags(node)
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name.startswith('test_'):
+                    doc = parse_test_doc(item.name, ast.get_docstring(item, clean=False))
+                    doc['tags'] += suite_tags
+                    body = '\n'.join(lines[item.lineno - 1:item.end_lineno]) + '\n'
+                    tests[item.name] = dict(cls=node.name, line=item.lineno, doc=doc, steps=test_steps(body),
+                                            codes=error_codes(item))
+        return tests
+
+    def save(self):
+        """
+            Writes the index out, replacing the old file in one step so other processes never read half an index
+        """
+        directory = os.path.dirname(self.path)
+        try:
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+            with open(tmp_path, 'w') as outfile:
+                json.dump(dict(version=VERSION, modules=self.modules), outfile, sort_keys=True)
+            os.replace(tmp_path, self.path)
+            self.changed = False
+        except (IOError, OSError) as e:
+            logger.warning("Could not save the test index to {}: {}".format(self.path, e))
+
+    def find(self, test_name):
+        """
+            @param test_name (string) - ti_login_0001 or test_ti_login_0001
+            @return (dict) - module, cls, line, doc, steps and codes of the test, None if there is no such test
+        """
+        return self.tests.get(test_name if test_name.startswith('test_') else 'test_{}'.format(test_name))
+
+    def select(self, test_list, tags=None, max_priority=None, environment=None):
+        """
+            Narrows a list of test_cases down using the metadata in the index, tests that aren't in the index are kept
+            so the run still reports them as not found
+            @param test_list (list) - Names of the test_cases
+            @param tags (list) - If set, only tests with at least one of these tags are kept
+            @param max_priority (int) - If set, only tests with this priority or a more important one (lower number)
+                   are kept, tests without a priority count as 3
+            @param environment (string) - If set, tests that only run in other environments (@note ENV=) or not in
+                   this one (@note ENV!=) are dropped
+            @return (list) - The test_cases that are left, in the same order
+        """
+        tags = set(tag.lower() for tag in tags) if tags else None
+        selected = []
+        for test in test_list:
+            entry = self.find(test)
+            if entry is None:
+                selected.append(test)
+                continue
+            doc = entry['doc']
+            if tags and not tags.intersection(doc['tags']):
+                continue
+            if max_priority is not None and test_priority(doc) > max_priority:
+                continue
+            if environment and not runs_in(doc, environment):
+                continue
+            selected.append(test)
+        if len(selected) != len(test_list):
+            logger.info("Selected {} of {} test_cases".format(len(selected), len(test_list)))
+        return selected
+
+    def skipped(self, test_list, environment, version=None):
+        """
+            Splits off the test_cases that would only skip themselves once running, so no browser is launched for them
+            @param test_list (list) - Names of the test_cases
+            @param environment (string) - The environment of the run
+            @param version (int) - The driver_version in the config, None if it isn't set
+            @return (tuple) - The test_cases to run, and a dict of the skipped ones to the reason they are skipped
+        """
+        to_run = []
+        skipped = {}
+        for test in test_list:
+            entry = self.find(test)
+            reason = skip_reason(entry['doc'], environment, version) if entry else None
+            if reason:
+                logger.info("Skipping [{}]: {}".format(test, reason))
+                skipped[test] = reason
+            else:
+                to_run.append(test)
+        return to_run, skipped
+
+    def ordered(self):
+        """
+            @return (list) - Names of all the tests, module by module in the order they are defined in
+        """
+        return sorted(self.tests, key=lambda test: (self.tests[test]['module'], self.tests[test]['line']))
+
+
+def get_index(refresh=False):
+    """
+        Loads the index once per process
+        @param refresh (bool) - Check the test modules for changes again, for processes that outlive a single run
+        @return TestIndex
+    """
+    global _index
+    if _index is None:
+        _index = TestIndex().load()
+    elif refresh:
+        _index.refresh()
+    return _index
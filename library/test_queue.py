@@ -0,0 +1,231 @@
+"""
+A SQLite backed queue of test_cases that any number of slap.py agents can pull from. Agents lease one test at a time,
+and a lease that is not completed or renewed before it times out (the agent crashed or was killed) goes back on the
+queue for the next agent to pick up.
+"""
+import logging
+import os
+import socket
+import sqlite3
+import threading
+from time import sleep, time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tests (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    priority REAL NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS tests_state ON tests (state, priority);
+"""
+
+
+class TestQueue(object):
+    """
+        Queue of test_cases stored in a SQLite file that is shared by all the agents of a run
+    """
+
+    def __init__(self, path, lease_timeout=600, max_attempts=3):
+        """
+            @param path (string) - Path to the SQLite file, created if it does not exist
+            @param lease_timeout (int) - Seconds an agent holds a test before it is handed to another agent
+            @param max_attempts (int) - How many times a test is leased before it is given up on
+        """
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        conn = sqlite3.connect(path, timeout=60)
+        try:
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    def connect(self):
+        """
+            Opens a new connection, one per call so the queue can be used from any thread or process
+            @return Connection
+        """
+        return Connection(self.path)
+
+    def enqueue(self, test_list, priorities=None):
+        """
+            Adds the test_cases to the queue, test_cases already in the queue are left as they are
+            @param test_list (list) - Names of the test_cases to add
+            @param priorities (dict) - Optional test name to priority, higher priority tests are leased first
+            @return (int) - Number of test_cases added
+        """
+        priorities = priorities or {}
+        with self.connect() as conn:
+            before = conn.execute("SELECT COUNT(*) FROM tests").fetchone()[0]
+            conn.executemany("INSERT OR IGNORE INTO tests (name, priority) VALUES (?, ?)",
+                             [(test, priorities.get(test, 0)) for test in test_list])
+            added = conn.execute("SELECT COUNT(*) FROM tests").fetchone()[0] - before
+        logger.info("Added {} test_cases to the queue {}".format(added, self.path))
+        if added < len(set(test_list)):
+            logger.warning("{} of the test_cases were already in the queue {} and were not added again".format(
+                len(set(test_list)) - added, self.path))
+        return added
+
+    def lease(self, owner):
+        """
+            Leases the next pending test, or a test whose lease has expired, to the owner
+            @param owner (string) - Unique name of the agent taking the test
+            @return (tuple) - The id and name of the test, or None if nothing is available right now
+        """
+        now = time()
+        with self.connect() as conn:
+            # TESTS THAT KEEP TAKING THEIR AGENT DOWN WITH THEM ARE GIVEN UP ON
+            conn.execute("UPDATE tests SET state = 'done', result = 'Lost' "
+                         "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, self.max_attempts))
+            row = conn.execute("SELECT id, name FROM tests "
+                               "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?) "
+                               "ORDER BY priority DESC, id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            if conn.execute("SELECT state FROM tests WHERE id = ?", (row[0],)).fetchone()[0] == 'leased':
+                logger.warning("Lease on [{}] expired, re-queuing it".format(row[1]))
+            conn.execute("UPDATE tests SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                         "WHERE id = ?", (owner, now + self.lease_timeout, row[0]))
+        return row
+
+    def renew(self, test_id, owner):
+        """
+            Pushes the lease of a running test out by another lease_timeout
+            @param test_id (int) - The id of the leased test
+            @param owner (string) - The agent holding the lease
+            @return (bool) - False if the lease was lost to another agent
+        """
+        with self.connect() as conn:
+            cursor = conn.execute("UPDATE tests SET lease_expires = ? WHERE id = ? AND owner = ? AND state = 'leased'",
+                                  (time() + self.lease_timeout, test_id, owner))
+            return cursor.rowcount == 1
+
+    def complete(self, test_id, owner, result):
+        """
+            Marks a leased test as done
+            @param test_id (int) - The id of the leased test
+            @param owner (string) - The agent holding the lease
+            @param result (string) - Passed, Failed, Skipped or Not Found
+        """
+        with self.connect() as conn:
+            conn.execute("UPDATE tests SET state = 'done', result = ?, lease_expires = NULL "
+                         "WHERE id = ? AND owner = ?", (result, test_id, owner))
+
+    def active(self):
+        """
+            @return (int) - Number of test_cases that are pending or still leased
+        """
+        with self.connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM tests WHERE state != 'done'").fetchone()[0]
+
+    def summary(self):
+        """
+            @return (dict) - Count of the test_cases in the queue by state and result
+        """
+        with self.connect() as conn:
+            rows = conn.execute("SELECT state, COALESCE(result, ''), COUNT(*) FROM tests GROUP BY 1, 2").fetchall()
+        return {"{} {}".format(state, result).strip(): count for state, result, count in rows}
+
+
+class Connection(object):
+    """
+        Context manager around a sqlite3 connection. Every block runs in its own write transaction, so two agents can
+        never lease the same test, and is committed on success, rolled back on error and always closed
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, timeout=60, isolation_level=None)
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.conn.close()
+
+
+class LeaseKeeper(threading.Thread):
+    """
+        Background thread renewing the lease of the running test so long tests are not handed to another agent
+    """
+
+    def __init__(self, queue, test_id, owner):
+        super(LeaseKeeper, self).__init__(daemon=True)
+        self.queue = queue
+        self.test_id = test_id
+        self.owner = owner
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.queue.lease_timeout / 3.0):
+            if not self.queue.renew(self.test_id, self.owner):
+                logger.warning("Lost the lease on test id {}".format(self.test_id))
+                break
+
+    def stop(self):
+        self.stopped.set()
+
+
+def agent_name(agent=None):
+    """
+        Builds a name for this agent that is unique across hosts and processes
+        @param agent (string) - The --agent value if there is one
+        @return string
+    """
+    return "{}:{}:{}".format(agent or 'agent', socket.gethostname(), os.getpid())
+
+
+def run_queue(queue, time_stamp, owner, results=None, on_result=None, poll=5):
+    """
+        Pulls test_cases off the queue and runs them until the queue is drained
+        @param queue (TestQueue) - The queue to pull from
+        @param time_stamp (string) - The time stamp of the run
+        @param owner (string) - Unique name of this agent
+        @param results (dict) - If passed, filled with the status of each test this agent ran by name
+        @param on_result (function) - If passed, called with the name, status and duration of each finished test
+        @param poll (int) - Seconds to wait before checking again while other agents still hold leases
+        @return (int) - The number of test_cases that failed on this agent
+    """
+    from library.helper import run_test, log_progress
+    fail_count = 0
+    fail_array = ""
+    count = 0
+    logger.info("Agent {} pulling test_cases from {}".format(owner, queue.path))
+    while True:
+        leased = queue.lease(owner)
+        if leased is None:
+            # NOTHING PENDING, BUT ANOTHER AGENT'S LEASE COULD STILL EXPIRE AND COME BACK TO THE QUEUE
+            if queue.active() == 0:
+                break
+            sleep(poll)
+            continue
+        test_id, test = leased
+        keeper = LeaseKeeper(queue, test_id, owner)
+        keeper.start()
+        start = time()
+        try:
+            status = run_test(test, time_stamp)
+        finally:
+            keeper.stop()
+        queue.complete(test_id, owner, status)
+        if results is not None:
+            results[test] = status
+        if on_result is not None:
+            on_result(test, status, time() - start)
+        count += 1
+        if status not in ('Passed', 'Skipped'):
+            fail_count += 1
+            fail_array = test if fail_array == "" else "{} {}".format(fail_array, test)
+        log_progress(test, count, count + queue.active(), status, fail_count, fail_array)
+    logger.info("Queue drained: {}".format(queue.summary()))
+    return fail_count
@@ -0,0 +1,137 @@
+"""
+Fork server. The parent process imports the framework, selenium and every test_case module and parses the test data
+once, then forks a fresh child for every test (or batch of tests). Each child starts with everything already loaded,
+and whatever a test changes in the borg Config or Core state (run_tests prefixing the run_id, the environment, the
+driver) dies with the child instead of leaking into the next test.
+
+Every child appends its results straight to the result stream of the run, see library.results. The status of each
+test is passed back to the parent over a pipe.
+"""
+import json
+import logging
+import os
+import select
+from time import time
+
+from library.config import Config
+
+logger = logging.getLogger(__name__)
+
+# EXIT CODE OF A CHILD THAT DIED BEFORE REPORTING ALL OF ITS TESTS
+CRASHED = 70
+
+
+def run_child(batch, time_stamp, index, write_fd):
+    """
+        Runs a batch of test_cases inside of a forked child, never returns
+        @param batch (list) - Names of the test_cases to run
+        @param time_stamp (string) - The time stamp of the run
+        @param index (int) - Number of the child
+        @param write_fd (int) - Pipe to write a json line with the name, status and duration of each test to
+    """
+    code = 0
+    try:
+        from library.helper import run_test, finish_run
+        config = Config()
+        with os.fdopen(write_fd, 'w') as pipe:
+            try:
+                for i, test in enumerate(batch):
+                    # NO BROWSER IS LAUNCHED IN THE BACKGROUND FOR A TEST THAT RUNS IN ANOTHER CHILD
+                    config['tests_remaining'] = len(batch) - i - 1
+                    start = time()
+                    status = run_test(test, time_stamp)
+                    pipe.write(json.dumps([test, status, time() - start]) + '\n')
+                    pipe.flush()
+            finally:
+                finish_run()
+    except BaseException:
+        logger.exception("Forked child {} crashed".format(index))
+        code = CRASHED
+    finally:
+        # SKIP atexit AND THE PARENT'S CLEANUP, THE CHILD SHARES ITS FILE DESCRIPTORS
+        os._exit(code)
+
+
+def run_forked(test_list, time_stamp, batch_size=1, workers=1, results=None, on_result=None):
+    """
+        Runs the test_cases in forked children of this process
+        @param test_list (list) - List of test_cases to run
+        @param time_stamp (string) - The time stamp of the run
+        @param batch_size (int) - How many test_cases each child runs
+        @param workers (int) - How many children run at the same time
+        @param results (dict) - If passed, filled with the status of each test by name
+        @param on_result (function) - If passed, called with the name, status and duration of each finished test
+        @return (int) - The number of failed test_cases
+    """
+    from library.helper import run_tests, preload_tests
+    if not hasattr(os, 'fork'):
+        logger.warning("This platform can't fork, running the test_cases one after another instead")
+        return run_tests(test_list, time_stamp, results, on_result)
+    # CHILDREN GET THE TEST DATA THE PARENT PARSED FOR FREE
+    preload_tests()
+    batches = [test_list[i:i + batch_size] for i in range(0, len(test_list), max(1, batch_size))]
+    logger.info("Forking {} children for {} test_cases, {} at a time".format(len(batches), len(test_list), workers))
+    running = {}
+    fail_count = 0
+    fail_array = ""
+    count = 0
+    for index, batch in enumerate(batches, 1):
+        while len(running) >= max(1, workers):
+            count, fail_count, fail_array = reap(running, len(test_list), count, fail_count, fail_array,
+                                                 results, on_result)
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            run_child(batch, time_stamp, index, write_fd)
+        os.close(write_fd)
+        running[pid] = (batch, read_fd, [])
+    while running:
+        count, fail_count, fail_array = reap(running, len(test_list), count, fail_count, fail_array,
+                                             results, on_result)
+    return fail_count
+
+
+def reap(running, total, count, fail_count, fail_array, results=None, on_result=None):
+    """
+        Reads what the children wrote to their pipes, and once a child closes its pipe waits for it to exit and
+        records the test_cases it ran, tests it never reported are failed. The pipes are read before the child is
+        waited on, a child with more results than the pipe holds would otherwise never exit
+        @param running (dict) - pid of each running child to its batch, the read end of its pipe and what was read
+        @param total (int) - How many tests are in the run
+        @param count (int) - How many tests have finished so far
+        @param fail_count (int) - How many tests have failed so far
+        @param fail_array (string) - Names of the tests that failed so far
+        @param results (dict) - If passed, filled with the status of each test by name
+        @param on_result (function) - If passed, called with the name, status and duration of each finished test
+        @return (tuple) - The updated count, fail_count and fail_array
+    """
+    from library.helper import log_progress
+    pids = {read_fd: pid for pid, (_, read_fd, _) in running.items()}
+    ready, _, _ = select.select(list(pids), [], [])
+    for read_fd in ready:
+        pid = pids[read_fd]
+        batch, _, chunks = running[pid]
+        data = os.read(read_fd, 65536)
+        if data:
+            chunks.append(data)
+            continue
+        # THE CHILD CLOSED ITS PIPE, IT IS DONE OR DIED
+        os.close(read_fd)
+        del running[pid]
+        _, status = os.waitpid(pid, 0)
+        reported = [json.loads(line) for line in b''.join(chunks).decode('utf-8').splitlines() if line.strip()]
+        if len(reported) < len(batch):
+            logger.error("Forked child running [{}] died with status {}".format(batch[len(reported)], status))
+            reported += [[test, 'Failed', 0.0] for test in batch[len(reported):]]
+        for test, test_status, duration in reported:
+            count += 1
+            if results is not None:
+                results[test] = test_status
+            if on_result is not None:
+                on_result(test, test_status, duration)
+            if test_status not in ('Passed', 'Skipped'):
+                fail_count += 1
+                fail_array = test if fail_array == "" else "{} {}".format(fail_array, test)
+            log_progress(test, count, total, test_status, fail_count, fail_array)
+    return count, fail_count, fail_array
@@ -3,21 +3,39 @@ import sys
 import time
 import os
 import uuid
-import urllib3
-from library.helper import get_args, get_all_list, get_tc_list, set_env, run_tests, create_json_info
+from library.helper import get_args, get_test_list, get_time_stamp, set_env, run_tests, create_json_info, finish_run, \
+    rerun_failures, write_final_results, skip_tests
 
 from shutil import rmtree, copy
 
 from library.config import Config
-from library.log import log_init
+from library.log import log_init, flush_logs
+from library.error_codes import check_error_codes
+from library.scheduler import load_durations, longest_first, expected_durations, print_plan, shard
 
-from urllib3.exceptions import InsecureRequestWarning
+# EVERYTHING ELSE (SELENIUM, REQUESTS, URLLIB3, THE FRAMEWORK, MULTIPROCESSING) IS IMPORTED BY THE CODE PATH THAT
+# NEEDS IT, SO --list, --plan AND --connect START QUICKLY. CHECK WITH --profile_startup
+
+
+def quiet_insecure_warnings():
+    """
+        Silences the warning urllib3 logs for every request to a host with a self signed certificate
+    """
+    import urllib3
+    from urllib3.exceptions import InsecureRequestWarning
+    urllib3.disable_warnings(InsecureRequestWarning)
 
-urllib3.disable_warnings(InsecureRequestWarning)
 
 if __name__ == '__main__':
     # GET ARGS FROM ARG PARSER
     args = get_args()
+    if args.profile_startup:
+        from library.startup import profile_startup
+        raise SystemExit(profile_startup(__file__, sys.argv[1:]))
+    # HAND THE RUN TO A DAEMON THAT ALREADY HAS EVERYTHING LOADED
+    if args.connect:
+        from library.server import connect
+        raise SystemExit(connect(args.connect, sys.argv[1:]))
     # Need to figure out where the config is, as automation may be executed from another path
     config_file_name = 'config.cfg'
     application_path = ''
@@ -45,12 +63,7 @@ if __name__ == '__main__':
     # CHANGE THE DIRECTORY TO THAT INDICATED IN THE CONFIG FILE
     os.chdir(config['living_dir'])
     # CREATE A TIME STAMP FOR LOGGING
-    tstruct = time.localtime()
-    seconds = tstruct.tm_hour * 3600 + tstruct.tm_min * 60 + tstruct.tm_sec
-    time_stamp = "{:02}_{:02}_{:02} {}".format(tstruct.tm_mon,
-                                               tstruct.tm_mday,
-                                               tstruct.tm_year,
-                                               seconds)
+    time_stamp = get_time_stamp()
     # CREATE DIRECTORY FOR OUTPUT LOGGING
     current_dir = os.path.join(config['output_dir'], 'current')
     if os.path.exists(current_dir):
@@ -65,24 +78,31 @@ if __name__ == '__main__':
     # CREATE THE HANDLERS
     log_init(lvl, config['log_dir'], config['run_id'])
 
+    # SET BEFORE --serve AS WELL, THE DAEMON STARTS EVERY RUN FROM THIS CONFIG
+    if args.reuse_browser is not None:
+        config['browser_reuse'] = args.reuse_browser
+    if args.pipeline:
+        config['pipeline'] = True
+    if args.lazy_browser:
+        config['lazy_browser'] = True
+
+    if args.serve:
+        from library.server import serve
+        quiet_insecure_warnings()
+        serve(args.serve, lvl)
+        sys.exit(0)
+
+    # SET THE ENVIRONMENT, TEST SELECTION DEPENDS ON IT
+    set_env(args, config)
+
     # FIGURE OUT WHAT KIND OF TEST WAS PASSED IN:
-    test_list = []
-    if args.test:
-        test_list = args.test
-    elif args.file:
-        test_list = []
-        # Get the basename of the file, which will be used for the xml name
-        file_base = os.path.basename(args.file.name)
-        # Populate the entries in the file into a list (array)
-        for line in args.file:
-            test_list.append(line.strip())
-        args.file.close()
-    elif args.suite:
-        for module in args.suite:
-            test_list += get_tc_list(module)
-    elif args.all:
-        for project in args.all:
-            test_list += get_all_list(project)
+    test_list = get_test_list(args)
+
+    durations = {}
+    if args.shard:
+        durations = load_durations(args.durations or [config['output_dir']],
+                                   None if args.durations else config['history_db'])
+        test_list = shard(test_list, args.shard[0], args.shard[1], durations)
 
     if args.list:
         # SORT THE LIST
@@ -91,6 +111,20 @@ if __name__ == '__main__':
         print("Total test_cases found: \n{}".format(len(test_list)))
         sys.exit(0)
 
+    # SCHEDULE THE LONGEST TESTS FIRST WHEN THEY ARE SPREAD ACROSS WORKERS OR AGENTS
+    if not durations and (args.plan or (test_list and (args.workers > 1 or args.queue))):
+        durations = load_durations(args.durations or [config['output_dir']],
+                                   None if args.durations else config['history_db'])
+    if durations:
+        test_list = longest_first(test_list, durations)
+
+    if args.plan:
+        print_plan(test_list, durations, args.workers)
+        sys.exit(0)
+
+    # CATCH ERROR CODES MISSING FROM THE CATALOG NOW, NOT WHEN A TEST FAILS WITH ONE
+    check_error_codes(test_list)
+
     # NAME THE JSON FILE
     json_file = os.path.join(current_dir, "Test_Results_{}.json".format(config['run_id']))
 
@@ -104,13 +138,65 @@ if __name__ == '__main__':
         config['device'] = args.device_type
 
     create_json_info()
+    if args.junit:
+        from framework.junit import start_report
+        config['junit_file'] = os.path.abspath(args.junit)
+        start_report(config['junit_file'], config['run_id'])
+    quiet_insecure_warnings()
+    # TESTS THAT WOULD ONLY SKIP THEMSELVES ARE RECORDED WITHOUT EVER STARTING A BROWSER
+    test_list, skipped = skip_tests(test_list)
 
-
-    # SET THE ENVIRONMENT
-    set_env(args, config)
     fail_count = 0
-    for x in range(0, args.loop):
-        fail_count = run_tests(test_list, time_stamp)
+    config['attempt'] = 1
+    if args.queue:
+        from library.test_queue import TestQueue, agent_name, run_queue
+        queue = TestQueue(args.queue, args.lease_timeout)
+        if test_list and not queue.enqueue(test_list, expected_durations(test_list, durations)) \
+                and not queue.active():
+            # A QUEUE FILE LEFT OVER FROM AN EARLIER RUN, RUNNING IT WOULD REPORT SUCCESS WITHOUT TESTING ANYTHING
+            flush_logs()
+            print("Every test_case passed in is already done in the queue {}, remove it or pass a new --queue to "
+                  "run them again".format(args.queue))
+            sys.exit(1)
+    # LOOPING OR SOAKING COLLECTS TIMINGS AND FAILURES ACROSS ALL THE ITERATIONS
+    soak_end = time.time() + args.soak if args.soak else None
+    if soak_end or args.loop > 1:
+        from library.soak import SoakStats
+        stats = SoakStats()
+    else:
+        stats = None
+    on_result = stats.record if stats else None
+    iterations = args.loop if args.loop > 1 or not soak_end else float('inf')
+    iteration = 0
+    # --loop 0 RUNS NOTHING
+    results = {}
+    attempts = {}
+    while iteration < iterations and (iteration == 0 or soak_end is None or time.time() < soak_end):
+        iteration += 1
+        results = {}
+        if args.queue:
+            run_queue(queue, time_stamp, agent_name(args.agent), results, on_result)
+        elif args.fork:
+            from library.zygote import run_forked
+            run_forked(test_list, time_stamp, args.fork, args.workers, results, on_result)
+        elif args.workers > 1:
+            from library.parallel import run_parallel
+            run_parallel(test_list, time_stamp, args.workers, lvl, results, on_result)
+        else:
+            run_tests(test_list, time_stamp, results, on_result)
+        attempts = rerun_failures(results, time_stamp, args.retries, args.workers, lvl, on_result, args.fork)
+        fail_count = len([status for status in results.values() if status not in ('Passed', 'Skipped')])
+        if stats:
+            stats.end_iteration(results)
+    if stats:
+        print(stats.report())
+        fail_count = sum(stats.iteration_failures)
+    finish_run()
+    results.update(skipped)
+    write_final_results(results, attempts)
+    if args.junit:
+        from framework.junit import finish_report
+        finish_report(config['junit_file'])
 
     output_dir = os.path.join(config['output_dir'], time_stamp)
     if args.save_log:
@@ -122,5 +208,7 @@ if __name__ == '__main__':
             if os.path.isfile(full_name):
                 copy(full_name, output_dir)
 
+    # THE SUMMARY COMES AFTER EVERYTHING THAT WAS LOGGED
+    flush_logs()
     print("Total Failures: [{}]".format(fail_count))
     raise SystemExit(fail_count)
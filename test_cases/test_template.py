@@ -5,11 +5,11 @@
 # Finally creates a core global object request_core for use in the test cases. 
 import unittest
 import inspect
-import re
-import yaml
 from unittest.util import safe_repr
 from xml.etree import ElementTree as et
 from library.config import Config
+from library.test_index import parse_test_doc, skip_reason
+from library.error_codes import get_catalog
 
 core = None
 
@@ -51,45 +51,8 @@ class TestTemplate(unittest.TestCase):
             @param name (string) - The name of the test
             @param doc_string (string) - the doc string of the test to parse
         """
-        # PARSE OUT THE DOXYGEN SETTINGS FROM THE STRING
         doc_string = doc_string if doc_string is not None else self._testMethodDoc
-        doc_list = [x.strip().replace('\t', '') for x in doc_string.split('\n') if len(x.strip().replace('\t', '')) > 0]
-        # CREATE DOC DICT OBJECT
-        doc_dict = dict(name=name, title=doc_list[0], bug='', tags=[])
-        for val in doc_list[1:]:
-            if '@test' in val:
-                doc_dict['test'] = val[5:]
-            elif '@arg' in val:
-                doc_dict['tags'] = [x.lower() for x in val[4:].split()]
-            elif '@attention' in val:
-                doc_dict['priority'] = val[10:]
-            elif '@author' in val:
-                doc_dict['author'] = val[7:]
-            elif '@date' in val:
-                doc_dict['date'] = val[5:]
-            elif '@bug' in val:
-                doc_dict['bug'] = val[4:].strip()
-            elif '@version' in val:
-                doc_dict['version'] = int(val[8:].replace(".", ""))
-            elif '@deprecated' in val:
-                doc_dict['deprecated'] = True
-            elif '@note' in val:
-                env_result = re.findall('ENV=(\w+)', val.upper())
-                if len(env_result) > 0:
-                    doc_dict['datacenters'] = env_result
-                env_not = re.findall('ENV!=(\w+)', val.upper())
-                if len(env_not) > 0:
-                    doc_dict['no_environment'] = env_not
-                priority = re.findall('priority=(\d)', val.lower())
-                if len(priority) > 0:
-                    doc_dict['priority'] = priority[0]
-                else:
-                    doc_dict['note'] = val[5:]
-        # CHECK IF TITLE AND NOTE NOT IN DOC_DICT
-        if 'title' not in doc_dict:
-            doc_dict['Title'] = 'TEST DOCUMENTATION DOES NOT INCLUDE THE TEST TITLE'
-        if 'test' not in doc_dict:
-            doc_dict['Test'] = 'TEST DOCUMENTATION DOES NOT INCLUDE TEST DESCRIPTION'
+        doc_dict = parse_test_doc(name, doc_string)
         self.doc_dict = doc_dict
 
     def assertFalse(self, expr, msg=None, data=None):
@@ -122,56 +85,22 @@ class TestTemplate(unittest.TestCase):
     def get_error_msg(self, msg='E9999'):
         """
             gets error message
+            @param msg (string) - An error code such as GOTO_0000, or a message of its own
+            @return string - The message of the error code from the error catalog, or msg if it isn't a known code
         """
-        config = Config()
-        # READ XML FILE AND PARSE TO XML OBJECT
-        error_dir = config['error_code_dir']
-        exclusion = config['error_code_exclusion']
-        file_list = []
-        import os
-        for filename in os.listdir(error_dir):
-            if filename.endswith('yaml') and filename not in exclusion:
-                file_list.append(os.path.join(error_dir, filename))
-        # Read in all the files and assign them to an ET Root
-        error_config = {}
-        for filename in file_list:
-            config = yaml.load(open(os.path.join(error_dir, filename), 'rb'))
-            error_config.update(config['errors'])
-
-        # FIND THE ERROR CODE BY BREAKING DOWN THE msg
-        if len(msg.split()) == 1:
-            # THIS COULD BE A SPECIAL ERROR MESSAGE
-            for key in error_config.keys():
-                if key in msg.lower():
-                    error_val = int(msg.split('_')[1])
-                    return error_config[key][error_val]
-        return msg
+        return get_catalog().lookup(msg)
 
     def ok_to_run(self):
         """
             Checks the docstring of the test and if either the version doesn't match or the env, will skip the test
+            @note Call it at the start of setUp, before getting the driver, so a skipped test never opens a browser.
+                  slap.py already leaves out the test_cases that skip, this catches tests run some other way
         """
-        # READING DOC STRING, LOOKING FOR VERSION
-        doc_dict = self.doc_dict
-        skip_test = False
-        msg = ''
-        if 'deprecated' in doc_dict:
-            msg = "This test has been deprecated"
-            skip_test = True
-        elif 'version' in doc_dict and int(self.core.config.get('TestRun', 'driver_version')) < doc_dict['version']:
-            msg = "Features unavailable in this version: {}".format(doc_dict['version'])
-            skip_test = True
-        elif 'datacenters' in doc_dict and len([s for s in doc_dict['datacenters'] if s in self.core.config.get('TestRun', 'datacenters')]) == 0:
-            msg = "Test only works in {}".format(doc_dict['datacenters'])
-            skip_test = True
-        elif 'no_environment' in doc_dict and self.core.config.get('TestRun', 'datacenters').upper() in doc_dict['no_environment']:
-            msg = "Test does not work in {}".format(doc_dict['no_environment'])
-            skip_test = True
-        if skip_test:
-            self.core.write("\n" + "_" * 40 + "\n{}".format(msg), level='error')
-            if self.core.driver is not None:
-                self.core.driver.close_driver()
-                self.core.driver_state = False
+        config = Config()
+        msg = skip_reason(self.doc_dict, config['environment'] or '',
+                          config['driver_version'] if 'driver_version' in config else None)
+        if msg:
+            logger.error("\n" + "_" * 40 + "\n{}".format(msg))
             self.skipTest(msg)
 
     def whoami(self):
@@ -36,10 +36,10 @@ class TIOForms(TestTemplate):
         @return:
         """
         logger.info("\n" + "_" * 40 + "\nSetup")
+        # Skip before getting the webdriver so a skipped test never opens a browser
+        self.ok_to_run()
         # Get the webdriver at the start of the test_cases
         ti.get_driver()
-        logger.info("Getting Version")
-        self.ok_to_run()
         self.longMessage = False
         ti.timer('start')
         logger.info("\n" + "_" * 40 + "\nTest Execution")
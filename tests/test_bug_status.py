@@ -0,0 +1,108 @@
+"""
+Runs the BugResolver against a stub of the Jira search api on localhost, python -m pytest tests
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from library.bug_status import BATCH_SIZE, BugResolver
+
+
+class StubJira(BaseHTTPRequestHandler):
+    """
+        Answers /rest/api/2/search for key in (...) searches from the bugs of the server, failing the whole search
+        with a 400 when one of the keys is unknown, the way Jira does without validateQuery=warn
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        keys = re.match(r'^key in \((.*)\)$', params['jql'][0]).group(1).split(',')
+        self.server.searches.append(keys)
+        unknown = [key for key in keys if key not in self.server.bugs]
+        if url.path != '/rest/api/2/search':
+            self.reply(404, {'errorMessages': ['Not found']})
+        elif unknown:
+            self.reply(400, {'errorMessages': ["An issue with key '{}' does not exist".format(unknown[0])]})
+        else:
+            self.reply(200, {'issues': [{'key': key, 'fields': self.server.bugs[key]} for key in keys]})
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def fields(status, *fix_versions):
+    return {'status': {'name': status}, 'fixVersions': [{'name': version} for version in fix_versions]}
+
+
+class TestBugResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubJira)
+        self.server.searches = []
+        self.server.bugs = {'ABC-{}'.format(i): fields('Open') for i in range(1, BATCH_SIZE + 11)}
+        self.server.bugs['ABC-1'] = fields('Closed', '1.0', '1.1')
+        self.server.bugs['ABC-2'] = fields('In Progress')
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api = 'http://127.0.0.1:{}/rest/api/2'.format(self.server.server_address[1])
+        self.directory = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.directory, 'bug_cache.json')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def resolver(self, ttl=3600):
+        return BugResolver(self.api, timeout=5, cache_file=self.cache_file, ttl=ttl)
+
+    def test_batches(self):
+        statuses = self.resolver().resolve(self.server.bugs)
+        self.assertEqual([len(keys) for keys in self.server.searches], [BATCH_SIZE, 10])
+        self.assertEqual(statuses['ABC-1'], '[Closed - 1.1]')
+        self.assertEqual(statuses['ABC-2'], '[In Progress]')
+        self.assertEqual(statuses['ABC-3'], '[Open]')
+
+    def test_cache(self):
+        self.resolver().resolve(['ABC-1', 'ABC-2'])
+        self.assertEqual(len(self.server.searches), 1)
+        # A NEW PROCESS READS THE STATUSES FROM THE CACHE FILE
+        self.assertEqual(self.resolver().resolve(['ABC-1', 'ABC-2']),
+                         {'ABC-1': '[Closed - 1.1]', 'ABC-2': '[In Progress]'})
+        self.assertEqual(len(self.server.searches), 1)
+        # AND LOOKS THEM UP AGAIN ONCE THEY ARE OLDER THAN THE TTL
+        self.resolver(ttl=0).resolve(['ABC-1', 'ABC-2'])
+        self.assertEqual(len(self.server.searches), 2)
+
+    def test_background(self):
+        resolver = self.resolver()
+        for bug_id in ('ABC-1', 'ABC-2', 'ABC-3'):
+            resolver.request(bug_id)
+        statuses = resolver.resolve(['ABC-1', 'ABC-2', 'ABC-3'])
+        self.assertEqual(statuses, {'ABC-1': '[Closed - 1.1]', 'ABC-2': '[In Progress]', 'ABC-3': '[Open]'})
+        # EVERY BUG WAS LOOKED UP ONCE, BY THE BACKGROUND THREAD OR BY resolve
+        self.assertEqual(sorted(key for keys in self.server.searches for key in keys), ['ABC-1', 'ABC-2', 'ABC-3'])
+
+    def test_unknown_bug(self):
+        statuses = self.resolver().resolve(['ABC-1', 'ABC-2', 'NOPE-1'])
+        self.assertEqual(statuses, {'ABC-1': '[Closed - 1.1]', 'ABC-2': '[In Progress]', 'NOPE-1': None})
+        # THE BATCH WAS TURNED DOWN, THEN EVERY BUG OF IT WAS LOOKED UP ON ITS OWN
+        self.assertEqual(self.server.searches, [['ABC-1', 'ABC-2', 'NOPE-1'], ['ABC-1'], ['ABC-2'], ['NOPE-1']])
+
+
+if __name__ == '__main__':
+    unittest.main()